@@ -1,15 +1,24 @@
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import pandas as pd
+import numpy as np
 import openpyxl
-import json
+import orjson
+import csv
+from concurrent.futures import ThreadPoolExecutor
+import io
 import os
+import pickle
+import threading
 from datetime import datetime
-from fuzzywuzzy import fuzz, process
+from rapidfuzz import fuzz, process, utils
 import re
 import database as db
+from json_provider import ORJSONProvider
+from parsing_engine import quantities_to_float
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # Initialize database
@@ -17,19 +26,205 @@ db.init_database()
 
 # Configuration
 PRODUCT_CATALOG_PATH = "products.csv"
+PRODUCT_CATALOG_CACHE_PATH = "products.pkl"
 ORDER_TEMPLATE_PATH = "order_template.xlsx"
 OUTPUT_DIR = "output"
+# Seconds a client is told to wait before retrying a download that is still being generated
+DOWNLOAD_RETRY_AFTER = 1
 
 # Ensure output directory exists
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Load product catalog
-product_catalog = pd.read_csv(PRODUCT_CATALOG_PATH)
-product_catalog.columns = product_catalog.columns.str.strip()
 
-# Create lookup dictionaries for faster matching
-article_to_product = dict(zip(product_catalog['Article Number'], product_catalog['Product']))
-product_to_article = dict(zip(product_catalog['Product'], product_catalog['Article Number']))
+def _load_catalog():
+    """
+    Load the product catalog lookup dictionaries.
+    The parsed dictionaries are pickled next to the CSV and reused until the CSV changes.
+    Returns: (catalog_size, article_to_product, product_to_article)
+    """
+    csv_mtime = os.path.getmtime(PRODUCT_CATALOG_PATH)
+    
+    try:
+        with open(PRODUCT_CATALOG_CACHE_PATH, 'rb') as f:
+            cached_mtime, catalog = pickle.load(f)
+        if cached_mtime == csv_mtime:
+            return catalog
+    except Exception:
+        pass
+    
+    product_catalog = pd.read_csv(PRODUCT_CATALOG_PATH)
+    product_catalog.columns = product_catalog.columns.str.strip()
+    catalog = (
+        len(product_catalog),
+        dict(zip(product_catalog['Article Number'], product_catalog['Product'])),
+        dict(zip(product_catalog['Product'], product_catalog['Article Number']))
+    )
+    
+    _save_catalog_cache(csv_mtime, catalog)
+    return catalog
+
+
+def _save_catalog_cache(csv_mtime, catalog):
+    """Pickle the catalog lookup dictionaries together with the CSV mtime they reflect."""
+    # Write to a temp file first so concurrent workers never read a partial pickle
+    try:
+        temp_path = f"{PRODUCT_CATALOG_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump((csv_mtime, catalog), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, PRODUCT_CATALOG_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def append_to_catalog(article_number, product_name):
+    """Append a product row to the catalog CSV, quoting fields that contain commas or quotes."""
+    with open(PRODUCT_CATALOG_PATH, 'a', newline='') as f:
+        f.write('\n')
+        csv.writer(f, lineterminator='').writerow([article_number, product_name])
+
+
+def _catalog_stamp():
+    """Identify the current catalog CSV contents by modification time and size."""
+    stat = os.stat(PRODUCT_CATALOG_PATH)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Load product catalog and lookup dictionaries for faster matching
+catalog_size, article_to_product, product_to_article = _load_catalog()
+# CSV stamp the in-memory catalog reflects; another worker appending to the
+# CSV changes it, see _reload_catalog_if_changed
+_catalog_stamp_loaded = _catalog_stamp()
+_catalog_lock = threading.Lock()
+
+
+def _token_sort_key(processed_name):
+    """Key under which two processed names score 100 with fuzz.token_sort_ratio."""
+    return " ".join(sorted(processed_name.split()))
+
+
+def _index_catalog():
+    """Build the derived lookup structures used by the matchers."""
+    global _product_list, _processed_products, _lower_product_to_article
+    global _article_list, _processed_articles, _token_key_to_index
+    
+    # Catalog names run through the fuzzy processor once, in article_to_product order
+    _product_list = list(article_to_product.values())
+    _processed_products = [utils.default_process(p) for p in _product_list]
+    _article_list = list(article_to_product.keys())
+    _processed_articles = [utils.default_process(a) for a in _article_list]
+    
+    # Case-folded product name -> (article, product); first catalog entry wins
+    _lower_product_to_article = {}
+    for article, product in article_to_product.items():
+        _lower_product_to_article.setdefault(product.lower(), (article, product))
+    
+    # Sorted-token key -> first catalog position; resolves perfect fuzzy scores
+    # with a single hash lookup instead of a scan over the catalog
+    _token_key_to_index = {}
+    for idx, processed in enumerate(_processed_products):
+        _token_key_to_index.setdefault(_token_sort_key(processed), idx)
+
+
+_index_catalog()
+
+
+def _reload_catalog_if_changed():
+    """Reload the catalog if the CSV changed since it was loaded, e.g. by another worker."""
+    global catalog_size, article_to_product, product_to_article, _catalog_stamp_loaded
+    if _catalog_stamp() == _catalog_stamp_loaded:
+        return
+    with _catalog_lock:
+        stamp = _catalog_stamp()
+        if stamp != _catalog_stamp_loaded:
+            catalog_size, article_to_product, product_to_article = _load_catalog()
+            _index_catalog()
+            _catalog_stamp_loaded = stamp
+
+# Lowercased synonym -> (article, product), rebuilt lazily from the database
+# when the products revision it was built from is out of date
+_synonym_index = {}
+_synonym_index_revision = None
+_synonym_index_dirty = True
+
+
+def _rebuild_synonym_index():
+    """Load all product synonyms from the database into the in-memory index."""
+    global _synonym_index, _synonym_index_dirty, _synonym_index_revision
+    
+    # Read first, so a change committed during the rebuild triggers another one
+    revision = db.get_products_revision()
+    index = {}
+    for db_product in db.get_all_products():
+        if db_product['synonyms']:
+            for synonym in orjson.loads(db_product['synonyms']):
+                index.setdefault(synonym.lower(), (db_product['article_number'], db_product['product_name']))
+    
+    _synonym_index = index
+    _synonym_index_revision = revision
+    _synonym_index_dirty = False
+
+
+# Per-row quantity flags returned by validate_quantities (uint8 bitmask)
+QTY_DECIMAL = 1
+QTY_HIGH = 2
+QTY_LOW = 4
+QTY_NEGATIVE = 8
+QTY_ZERO = 16
+QTY_INVALID = 32
+
+
+def validate_quantities(quantities):
+    """
+    Validate a sequence of quantities in one vectorized pass.
+    Returns: (valid mask, cleaned integer quantities, uint8 QTY_* flags); the
+    quantities are int64, or Python ints when a value exceeds the int64 range
+    """
+    values = quantities_to_float(quantities)
+    
+    invalid = ~np.isfinite(values)
+    safe = np.where(invalid, 0.0, values)
+    negative = ~invalid & (safe < 0)
+    zero = ~invalid & (safe == 0)
+    valid = ~(invalid | negative | zero)
+    
+    # Decimals are truncated, the high/low checks apply to the truncated value
+    truncated = np.trunc(safe)
+    cleaned = np.where(valid, truncated, 0)
+    if (cleaned >= 2.0 ** 63).any():
+        # Beyond int64: exact Python ints, as int(float(quantity)) gives
+        cleaned = np.array([int(value) for value in cleaned.tolist()], dtype=object)
+    else:
+        cleaned = cleaned.astype(np.int64)
+    
+    flags = (
+        (valid & (truncated != safe)) * QTY_DECIMAL
+        | (valid & (truncated > 100)) * QTY_HIGH
+        | (valid & (truncated < 1) & (truncated > 0)) * QTY_LOW
+        | negative * QTY_NEGATIVE
+        | zero * QTY_ZERO
+        | invalid * QTY_INVALID
+    ).astype(np.uint8)
+    
+    return valid, cleaned, flags
+
+
+def quantity_warnings(quantity, cleaned, flags):
+    """Decode the QTY_* flags of a single row into warning messages."""
+    if flags & QTY_INVALID:
+        return [f"Invalid quantity format: {quantity}"]
+    if flags & QTY_NEGATIVE:
+        return ["Negative quantity is not allowed"]
+    if flags & QTY_ZERO:
+        return ["Quantity cannot be zero"]
+    
+    warnings = []
+    if flags & QTY_DECIMAL:
+        warnings.append(f"Decimal quantity ({float(quantity)}) rounded to {cleaned}")
+    if flags & QTY_HIGH:
+        warnings.append(f"Unusually high quantity: {cleaned}")
+    if flags & QTY_LOW:
+        warnings.append(f"Unusually low quantity: {cleaned}")
+    return warnings
 
 
 def validate_quantity(quantity):
@@ -37,122 +232,200 @@ def validate_quantity(quantity):
     Validate quantity and return validation result with warnings.
     Returns: (is_valid, cleaned_quantity, warnings)
     """
-    warnings = []
-    
-    try:
-        # Convert to float first to handle decimals
-        qty_float = float(quantity)
-        
-        # Check for negative numbers
-        if qty_float < 0:
-            return False, 0, ["Negative quantity is not allowed"]
-        
-        # Check for zero
-        if qty_float == 0:
-            return False, 0, ["Quantity cannot be zero"]
-        
-        # Check for decimals
-        if qty_float != int(qty_float):
-            warnings.append(f"Decimal quantity ({qty_float}) rounded to {int(qty_float)}")
-            qty_float = int(qty_float)
-        
-        # Check for unusually high quantities
-        if qty_float > 100:
-            warnings.append(f"Unusually high quantity: {int(qty_float)}")
-        
-        # Check for unusually low quantities (but valid)
-        if qty_float < 1 and qty_float > 0:
-            warnings.append(f"Unusually low quantity: {qty_float}")
-        
-        return True, int(qty_float), warnings
-        
-    except (ValueError, TypeError):
-        return False, 0, [f"Invalid quantity format: {quantity}"]
+    valid, cleaned, flags = validate_quantities([quantity])
+    return bool(valid[0]), int(cleaned[0]), quantity_warnings(quantity, int(cleaned[0]), int(flags[0]))
 
 
-def fuzzy_match_product(input_product, threshold=80):
+def _match_exact_product(input_product):
     """
-    Fuzzy match a product name against the catalog with synonym support.
-    Returns the best match (Article Number, Product Name, Score) or (None, None, 0) if no good match.
+    Match a product name exactly (case-insensitive) against catalog names and synonyms.
+    Returns (Article Number, Product Name) or None.
     """
-    # First try exact match (case-insensitive)
-    for article, product in article_to_product.items():
-        if product.lower() == input_product.lower():
-            return article, product, 100
+    hit = _lower_product_to_article.get(input_product.lower())
+    if hit:
+        return hit
     
     # Check database for synonyms
-    db_products = db.get_all_products()
-    for db_product in db_products:
-        if db_product['synonyms']:
-            synonyms = json.loads(db_product['synonyms'])
-            for synonym in synonyms:
-                if synonym.lower() == input_product.lower():
-                    return db_product['article_number'], db_product['product_name'], 100
+    if _synonym_index_dirty:
+        _rebuild_synonym_index()
+    return _synonym_index.get(input_product.lower())
+
+
+def _best_catalog_matches(queries, choices, scorer, threshold):
+    """
+    Score every (pre-processed) query against every choice in a single cdist call.
+    Returns, per query, (choice index, score) of the best match or None below threshold.
+    Ties go to the first choice, as with process.extractOne.
+    """
+    if not queries or not choices:
+        return [None] * len(queries)
     
-    # Try fuzzy matching
-    product_list = list(article_to_product.values())
-    best_match = process.extractOne(input_product, product_list, scorer=fuzz.token_sort_ratio)
+    # The cutoff lets the scorer bail out early on hopeless pairs (they come back as 0),
+    # float scores keep near-ties apart, and workers=-1 spreads rows over all cores
+    scores = process.cdist(
+        queries, choices, scorer=scorer, processor=None,
+        score_cutoff=threshold, dtype=np.float64, workers=-1
+    )
+    best_idx = scores.argmax(axis=1)
+    best_score = scores[np.arange(len(queries)), best_idx]
+    
+    return [
+        (idx, score) if score >= threshold else None
+        for idx, score in zip(best_idx.tolist(), best_score.tolist())
+    ]
+
+
+def match_products(product_names, threshold=80):
+    """
+    Match product names against the catalog with synonym support: exact names
+    and synonyms first, then the same words in any order, then one fuzzy pass
+    over whatever is left.
+    Returns, per name, (Article Number, Product Name, Score) or (None, None, 0) if no good match.
+    """
+    results = [(None, None, 0)] * len(product_names)
+    residual_rows = []
+    residual_queries = []
+    
+    for i, product_name in enumerate(product_names):
+        # First try exact match (case-insensitive) on names and synonyms
+        hit = _match_exact_product(product_name)
+        if hit:
+            results[i] = (hit[0], hit[1], 100)
+            continue
+        
+        # Same words in any order is a perfect token_sort_ratio score
+        query = utils.default_process(product_name)
+        idx = _token_key_to_index.get(_token_sort_key(query))
+        if idx is not None:
+            results[i] = (product_to_article[_product_list[idx]], _product_list[idx], 100)
+        else:
+            residual_rows.append(i)
+            residual_queries.append(query)
     
-    if best_match and best_match[1] >= threshold:
-        matched_product = best_match[0]
-        matched_article = product_to_article[matched_product]
-        return matched_article, matched_product, best_match[1]
+    # Try fuzzy matching
+    fuzzy_hits = _best_catalog_matches(
+        residual_queries, _processed_products, fuzz.token_sort_ratio, threshold
+    )
+    for i, hit in zip(residual_rows, fuzzy_hits):
+        if hit:
+            matched_product = _product_list[hit[0]]
+            results[i] = (product_to_article[matched_product], matched_product, round(hit[1]))
     
-    return None, None, 0
+    return results
+
+
+def fuzzy_match_product(input_product, threshold=80):
+    """
+    Fuzzy match a product name against the catalog with synonym support.
+    Returns the best match (Article Number, Product Name, Score) or (None, None, 0) if no good match.
+    """
+    return match_products([input_product], threshold)[0]
+
+
+# Header keywords for the order columns, checked in this priority order
+PRODUCT_KEYWORDS = ('product', 'item', 'name')
+QUANTITY_KEYWORDS = ('quantity', 'qty', 'amount')
+ARTICLE_KEYWORDS = ('article', 'sku', 'code')
+
+# Header label -> column role (0 article, 1 product, 2 quantity, None), shared across uploads
+_header_roles = {}
+
+
+def _column_role(header):
+    """Classify a header label, memoized per label."""
+    role = _header_roles.get(header, -1)
+    if role == -1:
+        header_lower = header.lower()
+        if any(word in header_lower for word in PRODUCT_KEYWORDS):
+            role = 1
+        elif any(word in header_lower for word in QUANTITY_KEYWORDS):
+            role = 2
+        elif any(word in header_lower for word in ARTICLE_KEYWORDS):
+            role = 0
+        else:
+            role = None
+        _header_roles[header] = role
+    return role
+
+
+def _detect_columns(columns):
+    """
+    Identify the article, product and quantity columns of an order sheet.
+    Returns: (article_idx, product_idx, quantity_idx) positions, None if not found
+    """
+    found = [None, None, None]
+    # The last matching column wins, so scan from the right and stop once all are set
+    for idx in range(len(columns) - 1, -1, -1):
+        if columns[idx] is None:
+            continue
+        role = _column_role(str(columns[idx]))
+        if role is not None and found[role] is None:
+            found[role] = idx
+            if None not in found:
+                break
+    return tuple(found)
+
+
+def _legacy_excel_rows(file_path):
+    """Read the first sheet of a legacy .xls file as row tuples, with None for empty cells."""
+    df = pd.read_excel(file_path, header=None, dtype=object)
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
 
 
-def parse_excel_order(file_path):
-    """Parse an Excel order file."""
+def parse_excel_order(file_path, legacy=False):
+    """
+    Parse an Excel order file (path or binary file-like object).
+    legacy marks a .xls (BIFF) file, which openpyxl cannot read; it is read through pandas.
+    """
     try:
-        df = pd.read_excel(file_path)
-        # Look for columns that might contain product info and quantities
-        # Common patterns: Product, Article, Item, Quantity, Qty, Amount
-        
-        # Try to identify columns
-        product_col = None
-        quantity_col = None
-        article_col = None
-        
-        for col in df.columns:
-            col_lower = str(col).lower()
-            if 'product' in col_lower or 'item' in col_lower or 'name' in col_lower:
-                product_col = col
-            elif 'quantity' in col_lower or 'qty' in col_lower or 'amount' in col_lower:
-                quantity_col = col
-            elif 'article' in col_lower or 'sku' in col_lower or 'code' in col_lower:
-                article_col = col
-        
-        orders = []
-        for _, row in df.iterrows():
-            # Skip empty rows
-            if row.isna().all():
-                continue
-            
-            product_name = None
-            article_number = None
-            quantity = None
-            
-            # Get article number if available
-            if article_col and pd.notna(row[article_col]):
-                article_number = str(row[article_col]).strip()
-            
-            # Get product name
-            if product_col and pd.notna(row[product_col]):
-                product_name = str(row[product_col]).strip()
-            
-            # Get quantity
-            if quantity_col and pd.notna(row[quantity_col]):
-                try:
-                    quantity = int(float(row[quantity_col]))
-                except:
-                    continue
+        if legacy:
+            wb = None
+            rows = _legacy_excel_rows(file_path)
+        else:
+            # Stream the sheet row by row instead of building a DataFrame
+            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            rows = wb.active.iter_rows(values_only=True)
+        try:
+            header = next(rows, ())
+            # Look for columns that might contain product info and quantities
+            # Common patterns: Product, Article, Item, Quantity, Qty, Amount
+            article_col, product_col, quantity_col = _detect_columns(header)
             
-            if (product_name or article_number) and quantity and quantity > 0:
-                orders.append({
-                    'product_name': product_name,
-                    'article_number': article_number,
-                    'quantity': quantity
-                })
+            orders = []
+            for values in rows:
+                article_value, product_value, quantity_value = (
+                    values[i] if i is not None and i < len(values) else None
+                    for i in (article_col, product_col, quantity_col)
+                )
+                
+                product_name = None
+                article_number = None
+                quantity = None
+                
+                # Get article number if available
+                if article_value is not None:
+                    article_number = str(article_value).strip()
+                
+                # Get product name
+                if product_value is not None:
+                    product_name = str(product_value).strip()
+                
+                # Get quantity
+                if quantity_value is not None:
+                    try:
+                        quantity = int(float(quantity_value))
+                    except:
+                        continue
+                
+                if (product_name or article_number) and quantity and quantity > 0:
+                    orders.append({
+                        'product_name': product_name,
+                        'article_number': article_number,
+                        'quantity': quantity
+                    })
+        finally:
+            if wb is not None:
+                wb.close()
         
         return orders
     except Exception as e:
@@ -160,44 +433,36 @@ def parse_excel_order(file_path):
 
 
 def parse_csv_order(file_path):
-    """Parse a CSV order file."""
+    """Parse a CSV order file (path or file-like object)."""
     try:
         df = pd.read_csv(file_path)
             # Reuse the logic for identifying product and quantity columns from parse_excel_order
         # after loading as CSV
         
         # Try to identify columns
-        product_col = None
-        quantity_col = None
-        article_col = None
-        
-        for col in df.columns:
-            col_lower = str(col).lower()
-            if 'product' in col_lower or 'item' in col_lower or 'name' in col_lower:
-                product_col = col
-            elif 'quantity' in col_lower or 'qty' in col_lower or 'amount' in col_lower:
-                quantity_col = col
-            elif 'article' in col_lower or 'sku' in col_lower or 'code' in col_lower:
-                article_col = col
+        roles = [df.columns[idx] if idx is not None else None for idx in _detect_columns(df.columns)]
+        cols = [c for c in roles if c]
+        positions = [cols.index(c) if c else None for c in roles]
         
         orders = []
-        for _, row in df.iterrows():
-            if row.isna().all():
-                continue
+        for values in df[cols].dropna(how='all').itertuples(index=False, name=None):
+            article_value, product_value, quantity_value = (
+                values[i] if i is not None else None for i in positions
+            )
             
             product_name = None
             article_number = None
             quantity = None
             
-            if article_col and pd.notna(row[article_col]):
-                article_number = str(row[article_col]).strip()
+            if article_value is not None and article_value == article_value:
+                article_number = str(article_value).strip()
             
-            if product_col and pd.notna(row[product_col]):
-                product_name = str(row[product_col]).strip()
+            if product_value is not None and product_value == product_value:
+                product_name = str(product_value).strip()
             
-            if quantity_col and pd.notna(row[quantity_col]):
+            if quantity_value is not None and quantity_value == quantity_value:
                 try:
-                    quantity = int(float(row[quantity_col]))
+                    quantity = int(float(quantity_value))
                 except:
                     continue
             
@@ -214,10 +479,13 @@ def parse_csv_order(file_path):
 
 
 def parse_json_order(file_path):
-    """Parse a JSON order file."""
+    """Parse a JSON order file (path or file-like object)."""
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        if isinstance(file_path, (str, os.PathLike)):
+            with open(file_path, 'rb') as f:
+                data = orjson.loads(f.read())
+        else:
+            data = orjson.loads(file_path.read())
         
         # Support different JSON structures
         orders = []
@@ -248,11 +516,22 @@ def parse_json_order(file_path):
         raise Exception(f"Error parsing JSON file: {str(e)}")
 
 
+# Text order line patterns, compiled once at import
+_PAT_ART = re.compile(r'([A-Z0-9]+)\s*-\s*(.+?)[,: ]*(\d+)', re.IGNORECASE)
+_PAT_NQ = re.compile(r'(.+?)[,: ]*(\d+)')
+_PAT_QN = re.compile(r'(\d+)\s*[x×]?\s*(.+)')
+
+
 def parse_text_order(file_path):
-    """Parse a plain text order file."""
+    """Parse a plain text order file (path or file-like object)."""
     try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
+        if isinstance(file_path, (str, os.PathLike)):
+            with open(file_path, 'r') as f:
+                lines = f.readlines()
+        else:
+            if not isinstance(file_path, io.TextIOBase):
+                file_path = io.TextIOWrapper(file_path, encoding='utf-8')
+            lines = file_path.readlines()
         
         orders = []
         for line in lines:
@@ -267,7 +546,7 @@ def parse_text_order(file_path):
             # "Article Number - 5"
             
             # Pattern 1: Article Number - Product Name, Quantity
-            match = re.match(r'([A-Z0-9]+)\s*-\s*(.+?)[,: ]*(\d+)', line, re.IGNORECASE)
+            match = _PAT_ART.match(line)
             if match:
                 article_number = match.group(1).strip()
                 product_name = match.group(2).strip()
@@ -280,7 +559,7 @@ def parse_text_order(file_path):
                 continue
 
             # Pattern 2: Product Name, Quantity or Product Name: Quantity
-            match = re.match(r'(.+?)[,: ]*(\d+)', line)
+            match = _PAT_NQ.match(line)
             if match:
                 product_name = match.group(1).strip()
                 quantity = int(match.group(2))
@@ -292,7 +571,7 @@ def parse_text_order(file_path):
                 continue
             
             # Pattern 3: Quantity x Product Name or Quantity Product Name
-            match = re.match(r'(\d+)\s*[x×]?\s*(.+)', line)
+            match = _PAT_QN.match(line)
             if match:
                 quantity = int(match.group(1))
                 product_name = match.group(2).strip()
@@ -312,16 +591,75 @@ def process_order(orders):
     """
     Process and validate orders against the product catalog.
     Returns a list of validated orders with match information.
+    
+    Matching runs column-wise over the whole order: exact article numbers are
+    resolved with a single Series.map, and the rows left for each fuzzy pass are
+    scored against the catalog together in one cdist call (see match_products).
     """
+    if not orders:
+        return []
+    
+    df = pd.DataFrame(orders, columns=['article_number', 'product_name'], dtype=object)
+    n = len(df)
+    
+    # Validate quantity for all rows at once
+    quantities = [order['quantity'] for order in orders]
+    valid, cleaned_quantities, qty_flags = validate_quantities(quantities)
+    
+    has_article = valid & df['article_number'].fillna('').astype(bool).to_numpy()
+    has_product = valid & df['product_name'].fillna('').astype(bool).to_numpy()
+    
+    matched_articles = [None] * n
+    matched_products = [None] * n
+    match_scores = [0] * n
+    match_methods = [None] * n
+    
+    # If article number is provided, try to match by article number first
+    exact_products = df['article_number'].map(article_to_product)
+    exact_rows = has_article & exact_products.notna().to_numpy()
+    for i in np.flatnonzero(exact_rows).tolist():
+        matched_articles[i] = orders[i]['article_number']
+        matched_products[i] = exact_products.iat[i]
+        match_scores[i] = 100
+        match_methods[i] = "Article Number"
+    
+    # Try fuzzy match on the remaining article numbers
+    fuzzy_rows = np.flatnonzero(has_article & ~exact_rows).tolist()
+    fuzzy_hits = _best_catalog_matches(
+        [utils.default_process(orders[i]['article_number']) for i in fuzzy_rows],
+        _processed_articles, fuzz.ratio, 85
+    )
+    for i, hit in zip(fuzzy_rows, fuzzy_hits):
+        if hit:
+            matched_articles[i] = _article_list[hit[0]]
+            matched_products[i] = article_to_product[matched_articles[i]]
+            match_scores[i] = round(hit[1])
+            match_methods[i] = "Fuzzy Article Number"
+    
+    # If no match yet and product name is provided, try to match by product name
+    product_rows = [i for i in np.flatnonzero(has_product).tolist() if not matched_articles[i]]
+    product_hits = match_products([orders[i]['product_name'] for i in product_rows])
+    for i, (article, product, score) in zip(product_rows, product_hits):
+        if article:
+            matched_articles[i] = article
+            matched_products[i] = product
+            match_scores[i] = score
+            match_methods[i] = "Product Name"
+    
+    # Look up availability for all matched products in one query
+    db_products = db.get_products_by_articles(
+        matched_articles[i] for i in range(n) if valid[i] and matched_articles[i]
+    )
+    
     validated_orders = []
     
-    for order in orders:
+    for i, order in enumerate(orders):
         article_number = order.get('article_number')
         product_name = order.get('product_name')
-        quantity = order['quantity']
-        
-        # Validate quantity
-        is_valid_qty, cleaned_qty, qty_warnings = validate_quantity(quantity)
+        is_valid_qty = valid[i]
+        cleaned_qty = int(cleaned_quantities[i])
+        # Only rows with flags set need their warning strings built
+        qty_warnings = quantity_warnings(quantities[i], cleaned_qty, int(qty_flags[i])) if qty_flags[i] else []
         
         if not is_valid_qty:
             validated_orders.append({
@@ -337,38 +675,12 @@ def process_order(orders):
             })
             continue
         
-        matched_article = None
-        matched_product = None
-        match_score = 0
-        match_method = None
-        
-        # If article number is provided, try to match by article number first
-        if article_number:
-            if article_number in article_to_product:
-                matched_article = article_number
-                matched_product = article_to_product[article_number]
-                match_score = 100
-                match_method = "Article Number"
-            else:
-                # Try fuzzy match on article number
-                article_list = list(article_to_product.keys())
-                best_match = process.extractOne(article_number, article_list, scorer=fuzz.ratio)
-                if best_match and best_match[1] >= 85:
-                    matched_article = best_match[0]
-                    matched_product = article_to_product[matched_article]
-                    match_score = best_match[1]
-                    match_method = "Fuzzy Article Number"
-        
-        # If no match yet and product name is provided, try to match by product name
-        if not matched_article and product_name:
-            matched_article, matched_product, match_score = fuzzy_match_product(product_name)
-            if matched_article:
-                match_method = "Product Name"
+        matched_article = matched_articles[i]
         
         # Check product availability in database
         product_warnings = []
         if matched_article:
-            db_product = db.get_product_by_article(matched_article)
+            db_product = db_products.get(matched_article)
             if db_product:
                 if not db_product['is_available']:
                     product_warnings.append("Product is marked as unavailable")
@@ -381,10 +693,10 @@ def process_order(orders):
             'original_product': product_name or article_number,
             'original_article': article_number,
             'matched_article': matched_article,
-            'matched_product': matched_product,
+            'matched_product': matched_products[i],
             'quantity': cleaned_qty,
-            'match_score': match_score,
-            'match_method': match_method,
+            'match_score': match_scores[i],
+            'match_method': match_methods[i],
             'status': 'matched' if matched_article else 'unmatched',
             'warnings': all_warnings if all_warnings else None
         })
@@ -392,47 +704,169 @@ def process_order(orders):
     return validated_orders
 
 
-def generate_erp_sheet(customer_id, validated_orders, output_filename):
+# Parsed ERP template, rebuilt only when the file changes:
+# (mtime, article_to_row, flat_rows, sheet_title)
+_template_cache = None
+
+
+def _is_flat_workbook(workbook):
     """
-    Generate an ERP order sheet by filling the template.
+    True if the workbook is a single sheet of plain cell values, with nothing
+    a write-only copy of the values would drop: styles, number formats,
+    column widths, row heights, merges, sheet features or defined names.
     """
-    try:
+    if len(workbook.worksheets) != 1 or workbook.chartsheets or len(workbook.defined_names):
+        return False
+    sheet = workbook.active
+    if (sheet.merged_cells.ranges or len(sheet.conditional_formatting)
+            or sheet.data_validations.dataValidation or sheet.auto_filter.ref
+            or sheet.freeze_panes or sheet.tables or sheet.defined_names
+            or sheet.print_area or sheet._images or sheet._charts
+            or sheet.sheet_properties.tabColor):
+        return False
+    if any(dim.customWidth or dim.hidden or dim.outlineLevel or dim.has_style
+           for dim in sheet.column_dimensions.values()):
+        return False
+    if any(dim.customHeight or dim.hidden or dim.outlineLevel or dim.has_style
+           for dim in sheet.row_dimensions.values()):
+        return False
+    return not any(
+        cell.has_style or cell.comment or cell.hyperlink
+        for row in sheet.iter_rows() for cell in row
+    )
+
+
+def _get_template():
+    """
+    Return the cached order template.
+    Returns: (article_to_row, flat_rows, sheet_title); flat_rows is None if the
+    template has formatting or features that only loading the workbook
+    preserves (see _is_flat_workbook).
+    """
+    global _template_cache
+    mtime = os.path.getmtime(ORDER_TEMPLATE_PATH)
+    if _template_cache is None or _template_cache[0] != mtime:
         workbook = openpyxl.load_workbook(ORDER_TEMPLATE_PATH)
         sheet = workbook.active
         
-        # Set Customer ID in B1
-        sheet["B1"] = customer_id
-        
         # Create a mapping from Article Number to row index
         article_to_row = {}
-        for row_idx in range(3, sheet.max_row + 1):
-            article_number = sheet[f"B{row_idx}"].value
+        rows = sheet.iter_rows(min_row=3, min_col=2, max_col=2, values_only=True)
+        for row_idx, (article_number,) in enumerate(rows, start=3):
             if article_number:
                 article_to_row[str(article_number).strip()] = row_idx
         
-        # Fill in quantities for matched orders
+        flat_rows = None
+        if _is_flat_workbook(workbook):
+            flat_rows = [list(row) for row in sheet.iter_rows(values_only=True)]
+        
+        _template_cache = (mtime, article_to_row, flat_rows, sheet.title)
+    return _template_cache[1:]
+
+
+def _set_value(values, column, value):
+    """Set a 1-based column in a row value list, padding it if needed."""
+    if len(values) < column:
+        values.extend([None] * (column - len(values)))
+    values[column - 1] = value
+
+
+def generate_erp_sheet(customer_id, validated_orders, output_filename):
+    """
+    Generate an ERP order sheet by filling the template.
+    """
+    try:
+        # Mapping from Article Number to row index, parsed once per template version
+        article_to_row, flat_rows, sheet_title = _get_template()
+        
+        # Quantities for matched orders by template row
+        row_quantities = {}
         for order in validated_orders:
             if order['status'] == 'matched':
                 article_number = order['matched_article']
                 quantity = order['quantity']
                 
                 if article_number in article_to_row:
-                    row_to_fill = article_to_row[article_number]
-                    sheet[f"G{row_to_fill}"] = quantity
+                    row_quantities[article_to_row[article_number]] = quantity
         
         output_path = os.path.join(OUTPUT_DIR, output_filename)
-        workbook.save(output_path)
+        # Saved under a temporary name and renamed, so other workers never
+        # serve a partly written sheet
+        temp_path = f"{output_path}.tmp"
+        
+        if flat_rows is not None:
+            # Plain-value template: stream rows straight to disk
+            workbook = openpyxl.Workbook(write_only=True)
+            sheet = workbook.create_sheet(sheet_title)
+            for row_idx, values in enumerate(flat_rows, start=1):
+                if row_idx == 1 or row_idx in row_quantities:
+                    values = list(values)
+                    if row_idx == 1:
+                        # Customer ID in B1
+                        _set_value(values, 2, customer_id)
+                    if row_idx in row_quantities:
+                        # Quantity goes in column G
+                        _set_value(values, 7, row_quantities[row_idx])
+                sheet.append(values)
+            if not flat_rows:
+                # Empty template: the sheet only holds the Customer ID in B1
+                sheet.append([None, customer_id])
+            workbook.save(temp_path)
+            os.replace(temp_path, output_path)
+            return output_path
+        
+        # Styled template: load it so formatting is preserved
+        workbook = openpyxl.load_workbook(ORDER_TEMPLATE_PATH)
+        sheet = workbook.active
+        
+        # Set Customer ID in B1
+        sheet.cell(row=1, column=2, value=customer_id)
+        
+        # Quantity goes in column G
+        for row_to_fill, quantity in row_quantities.items():
+            sheet.cell(row=row_to_fill, column=7, value=quantity)
+        
+        workbook.save(temp_path)
+        os.replace(temp_path, output_path)
         return output_path
     except Exception as e:
         raise Exception(f"Error generating ERP sheet: {str(e)}")
 
 
+# Background ERP sheet generation and order item persistence. Progress is
+# kept in the order's status column, so any worker process can report it.
+_executor = ThreadPoolExecutor(max_workers=4)
+
+
+def _finalize_order(order_id, customer_id, validated_orders, output_filename):
+    """Generate the ERP sheet and store the order items of an order; failures mark it failed."""
+    try:
+        generate_erp_sheet(customer_id, validated_orders, output_filename)
+        db.save_order_items(order_id, validated_orders)
+    except Exception as e:
+        db.mark_order_failed(order_id, e)
+
+
+def _submit_finalize(order_id, customer_id, validated_orders, output_filename):
+    """Queue _finalize_order for an order created with status 'pending'."""
+    _executor.submit(_finalize_order, order_id, customer_id, validated_orders, output_filename)
+
+
+@app.before_request
+def _refresh_shared_state():
+    """Pick up catalog and product changes made by other worker processes."""
+    global _synonym_index_dirty
+    _reload_catalog_if_changed()
+    if db.get_products_revision() != _synonym_index_revision:
+        _synonym_index_dirty = True
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
     return jsonify({
         'status': 'healthy',
-        'catalog_products': len(product_catalog),
+        'catalog_products': catalog_size,
         'timestamp': datetime.now().isoformat()
     })
 
@@ -455,35 +889,24 @@ def process_order_endpoint():
         # Get customer ID from form data
         customer_id = request.form.get('customer_id', 'UNKNOWN')
         
-        # Save uploaded file temporarily
-        temp_filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-        temp_path = os.path.join(OUTPUT_DIR, temp_filename)
-        file.save(temp_path)
-        
-        # Determine file type and parse accordingly
+        # Determine file type and parse the upload in memory
         file_ext = os.path.splitext(file.filename)[1].lower()
         
         if file_ext in ['.xlsx', '.xls']:
-            orders = parse_excel_order(temp_path)
+            orders = parse_excel_order(io.BytesIO(file.read()), legacy=file_ext == '.xls')
         elif file_ext == '.csv':
-            orders = parse_csv_order(temp_path)
+            orders = parse_csv_order(io.BytesIO(file.read()))
         elif file_ext == '.json':
-            orders = parse_json_order(temp_path)
+            orders = parse_json_order(io.BytesIO(file.read()))
         elif file_ext in ['.txt', '.text']:
-            orders = parse_text_order(temp_path)
+            orders = parse_text_order(io.BytesIO(file.read()))
         else:
-            os.remove(temp_path)
             return jsonify({'error': f'Unsupported file type: {file_ext}'}), 400
         
         # Process and validate orders
         validated_orders = process_order(orders)
         
-        # Generate ERP sheet
         output_filename = f"order_{customer_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        erp_sheet_path = generate_erp_sheet(customer_id, validated_orders, output_filename)
-        
-        # Clean up temp file
-        os.remove(temp_path)
         
         # Calculate statistics
         total_items = len(validated_orders)
@@ -496,8 +919,9 @@ def process_order_endpoint():
             'unmatched_items': unmatched_items
         }
         
-        # Save to order history
-        order_id = db.save_order_to_history(customer_id, statistics, validated_orders, output_filename)
+        # Save to order history, ERP sheet and order items are written in the background
+        order_id = db.create_order_history(customer_id, statistics, validated_orders, output_filename)
+        _submit_finalize(order_id, customer_id, validated_orders, output_filename)
         
         return jsonify({
             'success': True,
@@ -516,8 +940,17 @@ def process_order_endpoint():
 def download_file(filename):
     """Download a generated ERP sheet."""
     try:
+        # A file still being generated is not waited for: the client retries
+        status = db.get_output_status(filename)
+        if status and status[0] == 'failed':
+            return jsonify({'error': status[1]}), 500
+        
         file_path = os.path.join(OUTPUT_DIR, filename)
         if not os.path.exists(file_path):
+            if status and status[0] == 'pending':
+                response = jsonify({'error': 'File is still being generated'})
+                response.headers['Retry-After'] = str(DOWNLOAD_RETRY_AFTER)
+                return response, 503
             return jsonify({'error': 'File not found'}), 404
         
         return send_file(file_path, as_attachment=True, download_name=filename)
@@ -543,25 +976,13 @@ def process_text_order_endpoint():
         if not text_content.strip():
             return jsonify({'error': 'Text content is empty'}), 400
         
-        # Save text to a temporary file
-        temp_filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_text_order.txt"
-        temp_path = os.path.join(OUTPUT_DIR, temp_filename)
-        
-        with open(temp_path, 'w') as f:
-            f.write(text_content)
-        
-        # Parse the text order
-        orders = parse_text_order(temp_path)
-        
-        # Clean up temp file
-        os.remove(temp_path)
+        # Parse the text order (newline=None matches reading it back from a file)
+        orders = parse_text_order(io.StringIO(text_content, newline=None))
         
         # Process and validate orders
         validated_orders = process_order(orders)
         
-        # Generate ERP sheet
         output_filename = f"order_{customer_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        erp_sheet_path = generate_erp_sheet(customer_id, validated_orders, output_filename)
         
         # Calculate statistics
         total_items = len(validated_orders)
@@ -574,8 +995,9 @@ def process_text_order_endpoint():
             'unmatched_items': unmatched_items
         }
         
-        # Save to order history
-        order_id = db.save_order_to_history(customer_id, statistics, validated_orders, output_filename)
+        # Save to order history, ERP sheet and order items are written in the background
+        order_id = db.create_order_history(customer_id, statistics, validated_orders, output_filename)
+        _submit_finalize(order_id, customer_id, validated_orders, output_filename)
         
         return jsonify({
             'success': True,
@@ -597,20 +1019,21 @@ def search_product():
     if not query:
         return jsonify({'results': []})
     
-    # Fuzzy search
-    product_list = list(article_to_product.values())
-    matches = process.extract(query, product_list, scorer=fuzz.token_sort_ratio, limit=10)
+    # Fuzzy search (score_cutoff applies the minimum score threshold)
+    matches = process.extract(
+        utils.default_process(query), _processed_products,
+        scorer=fuzz.token_sort_ratio, processor=None, limit=10, score_cutoff=60
+    )
     
     results = []
-    for match in matches:
-        if match[1] >= 60:  # Minimum score threshold
-            product_name = match[0]
-            article_number = product_to_article[product_name]
-            results.append({
-                'article_number': article_number,
-                'product_name': product_name,
-                'score': match[1]
-            })
+    for _, score, idx in matches:
+        product_name = _product_list[idx]
+        article_number = product_to_article[product_name]
+        results.append({
+            'article_number': article_number,
+            'product_name': product_name,
+            'score': round(score)
+        })
     
     return jsonify({'results': results})
 
@@ -621,9 +1044,15 @@ def get_order_history_endpoint():
     try:
         limit = int(request.args.get('limit', 50))
         offset = int(request.args.get('offset', 0))
+        before_id = request.args.get('before_id', type=int)
         
-        orders = db.get_order_history(limit, offset)
-        return jsonify({'success': True, 'orders': orders})
+        orders = db.get_order_history(limit, offset, before_id)
+        return jsonify({
+            'success': True,
+            'orders': orders,
+            # Cursor for the next page, None on the last one
+            'next_before_id': orders[-1]['id'] if len(orders) == limit else None
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -668,16 +1097,37 @@ def add_product_endpoint():
         success, message = db.add_product(article_number, product_name, category, synonyms)
         
         if success:
-            # Reload product catalog
-            global product_catalog, article_to_product, product_to_article
-            product_catalog = pd.read_csv(PRODUCT_CATALOG_PATH)
-            product_catalog.columns = product_catalog.columns.str.strip()
-            article_to_product = dict(zip(product_catalog['Article Number'], product_catalog['Product']))
-            product_to_article = dict(zip(product_catalog['Product'], product_catalog['Article Number']))
+            global catalog_size, _catalog_stamp_loaded
+            
+            # Update the in-memory catalog instead of re-reading the CSV
+            is_new_article = article_number not in article_to_product
+            article_to_product[article_number] = product_name
+            product_to_article[product_name] = article_number
+            catalog_size += 1
+            if is_new_article:
+                _product_list.append(product_name)
+                _processed_products.append(utils.default_process(product_name))
+                _article_list.append(article_number)
+                _processed_articles.append(utils.default_process(article_number))
+                _lower_product_to_article.setdefault(product_name.lower(), (article_number, product_name))
+                _token_key_to_index.setdefault(
+                    _token_sort_key(_processed_products[-1]), len(_processed_products) - 1
+                )
+            else:
+                _index_catalog()
             
-            # Also add to CSV file
-            with open(PRODUCT_CATALOG_PATH, 'a') as f:
-                f.write(f'\n{article_number},{product_name}')
+            # Also add to CSV file; other workers reload it on their next request
+            with _catalog_lock:
+                # If another worker appended since the catalog was loaded, leave
+                # the stamp stale so the next request reloads both rows
+                up_to_date = _catalog_stamp() == _catalog_stamp_loaded
+                append_to_catalog(article_number, product_name)
+                if up_to_date:
+                    _catalog_stamp_loaded = _catalog_stamp()
+                    _save_catalog_cache(
+                        os.path.getmtime(PRODUCT_CATALOG_PATH),
+                        (catalog_size, article_to_product, product_to_article)
+                    )
             
             return jsonify({'success': True, 'message': message})
         else:
@@ -729,7 +1179,8 @@ if __name__ == '__main__':
     print("=" * 60)
     print("Order Processing System - Backend Server")
     print("=" * 60)
-    print(f"Product Catalog: {len(product_catalog)} products loaded")
+    print(f"Product Catalog: {catalog_size} products loaded")
     print(f"Server starting on http://localhost:5000")
+    print("Development server only - use 'gunicorn app:app' in production")
     print("=" * 60)
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
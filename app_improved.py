@@ -6,13 +6,18 @@ Integrates all enhancements: better parsing, caching, versioning, synonym manage
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import pandas as pd
+import numpy as np
 import openpyxl
-import json
+import orjson
 import os
 from datetime import datetime
-from fuzzywuzzy import fuzz, process
+from rapidfuzz import fuzz, process, utils
 import re
 import logging
+import io
+import csv
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 
 # Import our new modules
 import database as db
@@ -21,12 +26,20 @@ from parsing_engine import (
     TextOrderParser, ParsingAuditor, ParsedOrder, MatchMethod
 )
 from product_matcher import (
-    ProductCache, EnhancedProductMatcher, SynonymManager
+    ProductCache, EnhancedProductMatcher, SynonymManager, token_sort, top_catalog_matches
 )
 from unmatched_tracker import (
     UnmatchedTracker, UnmatchedReason, UnmatchedAnalyzer
 )
 from product_versioning import ProductVersionManager
+from json_provider import ORJSONProvider
+
+# Multithreaded Arrow CSV parsing when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +49,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # Initialize database
@@ -44,7 +58,11 @@ db.init_database()
 # Configuration
 PRODUCT_CATALOG_PATH = "products.csv"
 ORDER_TEMPLATE_PATH = "order_template.xlsx"
+TEMPLATE_INDEX_CACHE_PATH = "order_template.pkl"
 OUTPUT_DIR = "output"
+ORDERS_PREVIEW_LIMIT = 200
+# Seconds a client is told to wait before retrying a download that is still being generated
+DOWNLOAD_RETRY_AFTER = 1
 
 # Ensure output directory exists
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -55,15 +73,28 @@ synonym_manager = SynonymManager(db)
 version_manager = ProductVersionManager(db)
 product_matcher = EnhancedProductMatcher(product_cache)
 
+
 # Load and cache product catalog
 def refresh_product_cache():
     """Refresh the product cache from CSV and database"""
     try:
-        # Load from CSV
-        product_catalog = pd.read_csv(PRODUCT_CATALOG_PATH)
+        # Load from CSV: only the columns the cache uses, kept as text so
+        # numeric-looking article numbers are not turned into ints
+        product_catalog = pd.read_csv(
+            PRODUCT_CATALOG_PATH,
+            usecols=lambda col: col.strip() in ('Article Number', 'Product'),
+            dtype=str
+        )
         product_catalog.columns = product_catalog.columns.str.strip()
         
-        products_data = product_catalog.to_dict('records')
+        # Build the records column-wise rather than through to_dict('records')
+        products_data = [
+            {'Article Number': article, 'Product': name}
+            for article, name in zip(
+                product_catalog['Article Number'].tolist(),
+                product_catalog['Product'].tolist()
+            )
+        ]
         
         # Load from database (for synonyms)
         db_products = db.get_all_products()
@@ -81,6 +112,17 @@ def refresh_product_cache():
 refresh_product_cache()
 
 
+def append_to_catalog(article_number, product_name):
+    """Append a product row to the catalog CSV with a single O_APPEND write."""
+    row = io.StringIO()
+    csv.writer(row, lineterminator='').writerow([article_number, product_name])
+    fd = os.open(PRODUCT_CATALOG_PATH, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, f'\n{row.getvalue()}'.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
 def validate_quantity(quantity):
     """Validate quantity using the new validator"""
     return QuantityValidator.validate(quantity)
@@ -91,9 +133,14 @@ def fuzzy_match_product(input_product, input_article=None, threshold=80):
     Enhanced fuzzy matching using the new product matcher.
     Returns: (article_number, product_name, score, method)
     """
-    article, product, score, method = product_matcher.match_product(
-        input_product, input_article, threshold
-    )
+    result = product_matcher.match_product(input_product, input_article, threshold)
+    record_match_usage(input_product, result)
+    return result
+
+
+def record_match_usage(input_product, match_result):
+    """Track synonym usage and suggest new synonyms for a match result."""
+    article, product, score, method = match_result
     
     # Track synonym usage if it was a synonym match
     if method == 'synonym_match' and input_product:
@@ -104,111 +151,117 @@ def fuzzy_match_product(input_product, input_article=None, threshold=80):
         synonym_manager.suggest_synonym(
             input_product, article, product, score
         )
+
+
+# Workers for matching order lines; RapidFuzz releases the GIL while scoring
+_match_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Below this many distinct lines the pool costs more than it saves
+PARALLEL_MATCH_MIN_ROWS = 64
+
+
+def match_order_lines(keys, threshold=80):
+    """
+    Match distinct (product_name, article_number) pairs, in parallel for large orders.
+    Only the pure matching runs in the pool; callers apply record_match_usage.
+    Returns: {(product_name, article_number): (article_number, product_name, score, method)}
+    """
+    if len(keys) < PARALLEL_MATCH_MIN_ROWS:
+        results = [product_matcher.match_product(product, article, threshold) for product, article in keys]
+    else:
+        results = _match_executor.map(
+            lambda key: product_matcher.match_product(key[0], key[1], threshold), keys
+        )
+    return dict(zip(keys, results))
+
+
+def _orders_from_frame(df, detected_cols, source):
+    """
+    Build order dicts from the detected columns of an order sheet.
+    Columns are read whole instead of materializing a Series per row.
+    """
+    product_col = detected_cols['product_col']
+    quantity_col = detected_cols['quantity_col']
+    article_col = detected_cols['article_col']
+    
+    if not quantity_col or not (product_col or article_col):
+        return []
+    
+    # Rows need a quantity and at least a product name or article number
+    has_product = df[product_col].notna() if product_col else pd.Series(False, index=df.index)
+    has_article = df[article_col].notna() if article_col else pd.Series(False, index=df.index)
+    mask = (has_product | has_article) & df[quantity_col].notna()
+    
+    # Excel/CSV row number (1-indexed + header)
+    row_numbers = (df.index[mask] + 2).tolist()
+    quantities = df.loc[mask, quantity_col].tolist()
     
-    return article, product, score, method
+    product_names = [None] * len(row_numbers)
+    if product_col:
+        product_names = [
+            str(value).strip() if present else None
+            for value, present in zip(df.loc[mask, product_col].tolist(), has_product[mask].tolist())
+        ]
+    
+    article_numbers = [None] * len(row_numbers)
+    if article_col:
+        article_numbers = [
+            str(value).strip() if present else None
+            for value, present in zip(df.loc[mask, article_col].tolist(), has_article[mask].tolist())
+        ]
+    
+    return [
+        {
+            'product_name': product_name,
+            'article_number': article_number,
+            'quantity': quantity,
+            'row_number': row_number,
+            'source': source
+        }
+        for product_name, article_number, quantity, row_number
+        in zip(product_names, article_numbers, quantities, row_numbers)
+        if product_name or article_number
+    ]
 
 
 def parse_excel_order(file_path):
-    """Parse an Excel order file with improved column detection."""
+    """Parse an Excel order file (path or binary file-like) with improved column detection."""
     try:
         df = pd.read_excel(file_path)
         
         # Use improved column detector
         detected_cols = ColumnDetector.detect_columns(df.columns.tolist())
         
-        product_col = detected_cols['product_col']
-        quantity_col = detected_cols['quantity_col']
-        article_col = detected_cols['article_col']
-        
         logger.info(f"Detected columns: {detected_cols}")
         
-        orders = []
-        for idx, row in df.iterrows():
-            # Skip empty rows
-            if row.isna().all():
-                continue
-            
-            product_name = None
-            article_number = None
-            quantity = None
-            
-            # Get article number if available
-            if article_col and pd.notna(row[article_col]):
-                article_number = str(row[article_col]).strip()
-            
-            # Get product name
-            if product_col and pd.notna(row[product_col]):
-                product_name = str(row[product_col]).strip()
-            
-            # Get quantity
-            if quantity_col and pd.notna(row[quantity_col]):
-                quantity = row[quantity_col]
-            
-            if (product_name or article_number) and quantity is not None:
-                orders.append({
-                    'product_name': product_name,
-                    'article_number': article_number,
-                    'quantity': quantity,
-                    'row_number': idx + 2,  # Excel row number (1-indexed + header)
-                    'source': 'excel'
-                })
-        
-        return orders
+        return _orders_from_frame(df, detected_cols, 'excel')
     except Exception as e:
         raise Exception(f"Error parsing Excel file: {str(e)}")
 
 
 def parse_csv_order(file_path):
-    """Parse a CSV order file with improved column detection."""
+    """Parse a CSV order file (path or file-like) with improved column detection."""
     try:
-        df = pd.read_csv(file_path)
+        df = pd.read_csv(file_path, engine=CSV_ENGINE)
         
         # Use improved column detector
         detected_cols = ColumnDetector.detect_columns(df.columns.tolist())
         
-        product_col = detected_cols['product_col']
-        quantity_col = detected_cols['quantity_col']
-        article_col = detected_cols['article_col']
-        
         logger.info(f"Detected columns: {detected_cols}")
         
-        orders = []
-        for idx, row in df.iterrows():
-            if row.isna().all():
-                continue
-            
-            product_name = None
-            article_number = None
-            quantity = None
-            
-            if article_col and pd.notna(row[article_col]):
-                article_number = str(row[article_col]).strip()
-            
-            if product_col and pd.notna(row[product_col]):
-                product_name = str(row[product_col]).strip()
-            
-            if quantity_col and pd.notna(row[quantity_col]):
-                quantity = row[quantity_col]
-            
-            if (product_name or article_number) and quantity is not None:
-                orders.append({
-                    'product_name': product_name,
-                    'article_number': article_number,
-                    'quantity': quantity,
-                    'row_number': idx + 2,
-                    'source': 'csv'
-                })
-        
-        return orders
+        return _orders_from_frame(df, detected_cols, 'csv')
     except Exception as e:
         raise Exception(f"Error parsing CSV file: {str(e)}")
 
 
 def parse_json_order(file_path):
-    """Parse a JSON order file."""
+    """Parse a JSON order file (path or file-like)."""
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        if isinstance(file_path, (str, os.PathLike)):
+            with open(file_path, 'rb') as f:
+                data = orjson.loads(f.read())
+        else:
+            data = orjson.loads(file_path.read())
         
         orders = []
         
@@ -240,16 +293,22 @@ def parse_json_order(file_path):
 
 
 def parse_text_order(file_path):
-    """Parse a plain text order file with improved regex patterns."""
+    """Parse a plain text order file (path or file-like) with improved regex patterns."""
     try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
+        # One read and split; parse_line strips each line itself
+        if isinstance(file_path, (str, os.PathLike)):
+            with open(file_path, 'r') as f:
+                lines = f.read().split('\n')
+        else:
+            if not isinstance(file_path, io.TextIOBase):
+                file_path = io.TextIOWrapper(file_path, encoding='utf-8')
+            lines = file_path.read().split('\n')
         
         orders = []
-        parser = TextOrderParser()
+        parse_line = TextOrderParser.parse_line
         
         for idx, line in enumerate(lines):
-            parsed = parser.parse_line(line)
+            parsed = parse_line(line)
             
             if parsed:
                 parsed['row_number'] = idx + 1
@@ -261,26 +320,65 @@ def parse_text_order(file_path):
         raise Exception(f"Error parsing text file: {str(e)}")
 
 
+def get_suggestions(product_names, limit=5, min_score=60):
+    """
+    Get catalog suggestions for several unmatched product names at once.
+    Returns: one list of suggestion dicts per input name, best first
+    """
+    names, sorted_names = product_cache.get_name_lists()
+    queries = [token_sort(utils.default_process(name)) for name in product_names]
+    
+    all_suggestions = []
+    for matches in top_catalog_matches(queries, sorted_names, limit, min_score):
+        suggestions = []
+        for idx, score in matches:
+            articles = product_cache.articles_by_name.get(names[idx])
+            if articles:
+                suggestions.append({
+                    'product_name': names[idx],
+                    'article_number': articles[0],
+                    'score': round(score)
+                })
+        all_suggestions.append(suggestions)
+    
+    return all_suggestions
+
+
 def process_order(orders):
     """
     Process and validate orders with enhanced tracking and logging.
-    Returns validated orders and unmatched tracker.
+    Returns validated orders, unmatched tracker and a stats dict with the
+    'total', 'matched' and 'invalid_quantity' line counts.
     """
     validated_orders = []
+    matched_count = 0
+    invalid_count = 0
     unmatched_tracker = UnmatchedTracker()
     auditor = ParsingAuditor()
     
-    for order in orders:
+    # Unmatched items awaiting suggestions: (tracker item, product name)
+    needs_suggestions = []
+    
+    # Validate quantities, then match every distinct valid line up front so the
+    # matching can run in parallel; trackers are still filled in row order below
+    quantity_results = QuantityValidator.validate_many([order.get('quantity') for order in orders])
+    match_keys = list(dict.fromkeys(
+        (order.get('product_name'), order.get('article_number'))
+        for order, (is_valid_qty, _, _) in zip(orders, quantity_results)
+        if is_valid_qty
+    ))
+    match_results = match_order_lines(match_keys)
+    
+    for order, (is_valid_qty, cleaned_qty, qty_warnings) in zip(orders, quantity_results):
         article_number = order.get('article_number')
         product_name = order.get('product_name')
         quantity = order.get('quantity')
         row_number = order.get('row_number', 0)
         metadata = order.get('metadata', {})
         
-        # Validate quantity
-        is_valid_qty, cleaned_qty, qty_warnings = validate_quantity(quantity)
-        
         if not is_valid_qty:
+            invalid_count += 1
+            
             # Track as unmatched due to invalid quantity
             unmatched_tracker.add_unmatched(
                 original_text=product_name or article_number or str(quantity),
@@ -308,9 +406,9 @@ def process_order(orders):
             continue
         
         # Try to match product
-        matched_article, matched_product, match_score, match_method = fuzzy_match_product(
-            product_name, article_number
-        )
+        match_result = match_results[(product_name, article_number)]
+        record_match_usage(product_name, match_result)
+        matched_article, matched_product, match_score, match_method = match_result
         
         # Check product availability in database
         product_warnings = qty_warnings.copy()
@@ -326,27 +424,7 @@ def process_order(orders):
         if not matched_article:
             status = 'unmatched'
             
-            # Get suggestions for unmatched items
-            suggestions = []
-            if product_name:
-                all_products = product_cache.get_all_products()
-                product_names = [p['name'] for p in all_products]
-                matches = process.extract(
-                    product_name, product_names,
-                    scorer=fuzz.token_sort_ratio, limit=5
-                )
-                
-                for match in matches:
-                    if match[1] >= 60:
-                        articles = product_cache.get_articles_by_product(match[0])
-                        if articles:
-                            suggestions.append({
-                                'product_name': match[0],
-                                'article_number': articles[0],
-                                'score': match[1]
-                            })
-            
-            # Track as unmatched
+            # Track as unmatched; suggestions are filled in after the loop
             unmatched_tracker.add_unmatched(
                 original_text=product_name or article_number,
                 reason=UnmatchedReason.NO_MATCH_FOUND if match_score == 0 else UnmatchedReason.LOW_MATCH_SCORE,
@@ -355,11 +433,13 @@ def process_order(orders):
                     'article_number': article_number,
                     'best_score': match_score,
                     'row_number': row_number
-                },
-                suggestions=suggestions
+                }
             )
+            if product_name:
+                needs_suggestions.append((unmatched_tracker.unmatched_items[-1], product_name))
         else:
             status = 'matched'
+            matched_count += 1
             
             # Track warnings if any
             if product_warnings:
@@ -412,58 +492,168 @@ def process_order(orders):
             }
         )
     
-    return validated_orders, unmatched_tracker
+    # Get suggestions for all unmatched items in one batch
+    if needs_suggestions:
+        batch = get_suggestions([product_name for _, product_name in needs_suggestions])
+        for (item, _), suggestions in zip(needs_suggestions, batch):
+            item.suggestions = suggestions
+    
+    stats = {
+        'total': len(validated_orders),
+        'matched': matched_count,
+        'invalid_quantity': invalid_count
+    }
+    return validated_orders, unmatched_tracker, stats
+
+
+def normalize_article(article):
+    """
+    Normalize an article number for template lookups: trimmed, upper-case and
+    without the '.0' suffix Excel adds to numeric cells.
+    """
+    if article is None:
+        return None
+    if isinstance(article, float) and article.is_integer():
+        article = int(article)
+    key = str(article).strip().upper()
+    if key.endswith('.0') and key[:-2].isdigit():
+        key = key[:-2]
+    return key
+
+
+# Template file contents and Article Number -> row map, reloaded when the file changes
+_template_cache = None
+
+
+def get_order_template():
+    """
+    Return the cached order template.
+    Returns: (template_bytes, article_to_row)
+    """
+    global _template_cache
+    mtime = os.path.getmtime(ORDER_TEMPLATE_PATH)
+    if _template_cache is None or _template_cache[0] != mtime:
+        with open(ORDER_TEMPLATE_PATH, 'rb') as f:
+            template_bytes = f.read()
+        
+        article_to_row = _load_template_index(mtime, template_bytes)
+        _template_cache = (mtime, template_bytes, article_to_row)
+        logger.info(f"Order template loaded: {len(article_to_row)} article rows")
+    return _template_cache[1], _template_cache[2]
+
+
+def _load_template_index(mtime, template_bytes):
+    """
+    Return the template's Article Number -> row map, from the pickle cache
+    when it was built from the same template mtime.
+    """
+    try:
+        with open(TEMPLATE_INDEX_CACHE_PATH, 'rb') as f:
+            cached_mtime, article_to_row = pickle.load(f)
+        if cached_mtime == mtime:
+            return article_to_row
+    except Exception:
+        pass
+    
+    # Create a mapping from Article Number (column B) to row index
+    workbook = openpyxl.load_workbook(io.BytesIO(template_bytes), read_only=True)
+    try:
+        article_to_row = {}
+        rows = workbook.active.iter_rows(min_row=3, min_col=2, max_col=2, values_only=True)
+        for row_idx, (article_number,) in enumerate(rows, start=3):
+            if article_number:
+                article_to_row[normalize_article(article_number)] = row_idx
+    finally:
+        workbook.close()
+    
+    _save_template_index(mtime, article_to_row)
+    return article_to_row
+
+
+def _save_template_index(mtime, article_to_row):
+    """Pickle the template row map together with the template mtime it reflects."""
+    # Write to a temp file first so concurrent workers never read a partial pickle
+    try:
+        temp_path = f"{TEMPLATE_INDEX_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump((mtime, article_to_row), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, TEMPLATE_INDEX_CACHE_PATH)
+    except OSError:
+        pass
+
+
+# Load the template at startup instead of on the first order
+if os.path.exists(ORDER_TEMPLATE_PATH):
+    get_order_template()
 
 
 def generate_erp_sheet(customer_id, validated_orders, output_filename):
     """Generate an ERP order sheet by filling the template."""
     try:
-        workbook = openpyxl.load_workbook(ORDER_TEMPLATE_PATH)
+        template_bytes, article_to_row = get_order_template()
+        
+        # A writable workbook is still parsed per request, from memory
+        workbook = openpyxl.load_workbook(io.BytesIO(template_bytes))
         sheet = workbook.active
         
         # Set Customer ID in B1
-        sheet["B1"] = customer_id
-        
-        # Create a mapping from Article Number to row index
-        article_to_row = {}
-        for row_idx in range(3, sheet.max_row + 1):
-            article_number = sheet[f"B{row_idx}"].value
-            if article_number:
-                article_to_row[str(article_number).strip()] = row_idx
+        sheet.cell(row=1, column=2, value=customer_id)
         
-        # Fill in quantities for matched orders
+        # Group quantities for matched orders by template row
+        row_quantities = {}
         for order in validated_orders:
             if order['status'] == 'matched':
-                article_number = order['matched_article']
-                quantity = order['quantity']
-                
-                if article_number in article_to_row:
-                    row_to_fill = article_to_row[article_number]
-                    sheet[f"G{row_to_fill}"] = quantity
+                row_to_fill = article_to_row.get(normalize_article(order['matched_article']))
+                if row_to_fill:
+                    row_quantities[row_to_fill] = order['quantity']
         
+        # Quantity goes in column G
+        for row_to_fill, quantity in row_quantities.items():
+            sheet.cell(row=row_to_fill, column=7, value=quantity)
+        
+        # Saved under a temporary name and renamed, so other workers never
+        # serve a partly written sheet
         output_path = os.path.join(OUTPUT_DIR, output_filename)
-        workbook.save(output_path)
+        workbook.save(f"{output_path}.tmp")
+        os.replace(f"{output_path}.tmp", output_path)
         return output_path
     except Exception as e:
         raise Exception(f"Error generating ERP sheet: {str(e)}")
 
 
+def unmatched_report_filenames(output_filename):
+    """Return the (JSON, text) unmatched report filenames for an ERP sheet."""
+    return (
+        output_filename.replace('.xlsx', '_unmatched.json'),
+        output_filename.replace('.xlsx', '_unmatched.txt')
+    )
+
+
+def erp_sheet_filename(filename):
+    """Return the ERP sheet filename that an output file belongs to."""
+    for suffix in ('_unmatched.json', '_unmatched.txt'):
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)] + '.xlsx'
+    return filename
+
+
 def generate_unmatched_report(unmatched_tracker, output_filename):
     """Generate a detailed report of unmatched items."""
     try:
+        json_filename, txt_filename = unmatched_report_filenames(output_filename)
+        
+        # Both reports are written under a temporary name and renamed into place
         # Generate JSON report
-        json_filename = output_filename.replace('.xlsx', '_unmatched.json')
         json_path = os.path.join(OUTPUT_DIR, json_filename)
-        unmatched_tracker.export_to_json(json_path)
+        unmatched_tracker.export_to_json(f"{json_path}.tmp")
+        os.replace(f"{json_path}.tmp", json_path)
         
         # Generate text report
-        txt_filename = output_filename.replace('.xlsx', '_unmatched.txt')
         txt_path = os.path.join(OUTPUT_DIR, txt_filename)
         
-        report = unmatched_tracker.generate_report()
-        
-        with open(txt_path, 'w') as f:
-            f.write(report)
+        with open(f"{txt_path}.tmp", 'w') as f:
+            unmatched_tracker.write_report(f)
+        os.replace(f"{txt_path}.tmp", txt_path)
         
         return json_path, txt_path
     except Exception as e:
@@ -471,6 +661,58 @@ def generate_unmatched_report(unmatched_tracker, output_filename):
         return None, None
 
 
+# Background ERP sheet, report generation and order item persistence. Progress
+# is kept in the order's status column, so any worker process can report it.
+_executor = ThreadPoolExecutor(max_workers=4)
+
+
+def _finalize_order(order_id, customer_id, validated_orders, unmatched_tracker, output_filename):
+    """
+    Generate the ERP sheet and unmatched reports and store the order items of
+    an order; failures mark it failed.
+    """
+    try:
+        generate_erp_sheet(customer_id, validated_orders, output_filename)
+        generate_unmatched_report(unmatched_tracker, output_filename)
+        db.save_order_items(order_id, validated_orders)
+    except Exception as e:
+        logger.error(f"Error finalizing order {order_id}: {e}")
+        db.mark_order_failed(order_id, e)
+
+
+def _submit_finalize(order_id, customer_id, validated_orders, unmatched_tracker, output_filename):
+    """Queue _finalize_order for an order created with status 'pending'."""
+    _executor.submit(
+        _finalize_order, order_id, customer_id, validated_orders, unmatched_tracker, output_filename
+    )
+
+
+def orders_response(validated_orders, order_id, include=''):
+    """
+    Build the 'orders' part of a processing response.
+    
+    Bulk uploads can hold tens of thousands of lines, so by default only a
+    preview is returned; the rest is paged from /api/orders/<order_id>.
+    'include' is the request's 'include_orders' value: 'summary' (no lines),
+    'all', or a number of leading lines.
+    """
+    include = str(include or '')
+    if include == 'all':
+        orders = validated_orders
+    elif include == 'summary':
+        orders = []
+    elif include.isdigit():
+        orders = validated_orders[:int(include)]
+    else:
+        orders = validated_orders[:ORDERS_PREVIEW_LIMIT]
+    
+    return {
+        'orders': orders,
+        'orders_total': len(validated_orders),
+        'orders_url': f'/api/orders/{order_id}'
+    }
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint with cache info."""
@@ -512,63 +754,47 @@ def process_order_endpoint():
         # Get customer ID from form data
         customer_id = request.form.get('customer_id', 'UNKNOWN')
         
-        # Save uploaded file temporarily
-        temp_filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-        temp_path = os.path.join(OUTPUT_DIR, temp_filename)
-        file.save(temp_path)
-        
-        # Determine file type and parse accordingly
+        # Determine file type and parse the upload in memory
         file_ext = os.path.splitext(file.filename)[1].lower()
         
         if file_ext in ['.xlsx', '.xls']:
-            orders = parse_excel_order(temp_path)
+            orders = parse_excel_order(io.BytesIO(file.read()))
         elif file_ext == '.csv':
-            orders = parse_csv_order(temp_path)
+            orders = parse_csv_order(io.BytesIO(file.read()))
         elif file_ext == '.json':
-            orders = parse_json_order(temp_path)
+            orders = parse_json_order(io.BytesIO(file.read()))
         elif file_ext in ['.txt', '.text']:
-            orders = parse_text_order(temp_path)
+            orders = parse_text_order(io.BytesIO(file.read()))
         else:
-            os.remove(temp_path)
             return jsonify({'error': f'Unsupported file type: {file_ext}'}), 400
         
         # Process and validate orders
-        validated_orders, unmatched_tracker = process_order(orders)
+        validated_orders, unmatched_tracker, order_stats = process_order(orders)
         
-        # Generate ERP sheet
         output_filename = f"order_{customer_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        erp_sheet_path = generate_erp_sheet(customer_id, validated_orders, output_filename)
-        
-        # Generate unmatched report
-        json_report, txt_report = generate_unmatched_report(unmatched_tracker, output_filename)
-        
-        # Clean up temp file
-        os.remove(temp_path)
-        
-        # Calculate statistics
-        total_items = len(validated_orders)
-        matched_items = sum(1 for order in validated_orders if order['status'] == 'matched')
-        unmatched_items = total_items - matched_items
+        json_filename, txt_filename = unmatched_report_filenames(output_filename)
         
+        # Statistics from the counts kept by process_order
         statistics = {
-            'total_items': total_items,
-            'matched_items': matched_items,
-            'unmatched_items': unmatched_items,
+            'total_items': order_stats['total'],
+            'matched_items': order_stats['matched'],
+            'unmatched_items': order_stats['total'] - order_stats['matched'],
             'unmatched_summary': unmatched_tracker.get_summary()
         }
         
-        # Save to order history
-        order_id = db.save_order_to_history(customer_id, statistics, validated_orders, output_filename)
+        # Save to order history; ERP sheet, reports and order items are written in the background
+        order_id = db.create_order_history(customer_id, statistics, validated_orders, output_filename)
+        _submit_finalize(order_id, customer_id, validated_orders, unmatched_tracker, output_filename)
         
         return jsonify({
             'success': True,
             'customer_id': customer_id,
             'output_file': output_filename,
-            'unmatched_json': os.path.basename(json_report) if json_report else None,
-            'unmatched_txt': os.path.basename(txt_report) if txt_report else None,
+            'unmatched_json': json_filename,
+            'unmatched_txt': txt_filename,
             'order_id': order_id,
             'statistics': statistics,
-            'orders': validated_orders
+            **orders_response(validated_orders, order_id, request.values.get('include_orders'))
         })
     
     except Exception as e:
@@ -580,8 +806,17 @@ def process_order_endpoint():
 def download_file(filename):
     """Download a generated file."""
     try:
+        # A file still being generated is not waited for: the client retries
+        status = db.get_output_status(erp_sheet_filename(filename))
+        if status and status[0] == 'failed':
+            return jsonify({'error': status[1]}), 500
+        
         file_path = os.path.join(OUTPUT_DIR, filename)
         if not os.path.exists(file_path):
+            if status and status[0] == 'pending':
+                response = jsonify({'error': 'File is still being generated'})
+                response.headers['Retry-After'] = str(DOWNLOAD_RETRY_AFTER)
+                return response, 503
             return jsonify({'error': 'File not found'}), 404
         
         return send_file(file_path, as_attachment=True, download_name=filename)
@@ -819,53 +1054,36 @@ def process_text_order_endpoint():
         if not text_content.strip():
             return jsonify({'error': 'Text content is empty'}), 400
         
-        # Save text to a temporary file
-        temp_filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_text_order.txt"
-        temp_path = os.path.join(OUTPUT_DIR, temp_filename)
-        
-        with open(temp_path, 'w') as f:
-            f.write(text_content)
-        
-        # Parse the text order
-        orders = parse_text_order(temp_path)
-        
-        # Clean up temp file
-        os.remove(temp_path)
+        # Parse the text order (newline=None matches reading it back from a file)
+        orders = parse_text_order(io.StringIO(text_content, newline=None))
         
         # Process and validate orders
-        validated_orders, unmatched_tracker = process_order(orders)
+        validated_orders, unmatched_tracker, order_stats = process_order(orders)
         
-        # Generate ERP sheet
         output_filename = f"order_{customer_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        erp_sheet_path = generate_erp_sheet(customer_id, validated_orders, output_filename)
-        
-        # Generate unmatched report
-        json_report, txt_report = generate_unmatched_report(unmatched_tracker, output_filename)
-        
-        # Calculate statistics
-        total_items = len(validated_orders)
-        matched_items = sum(1 for order in validated_orders if order['status'] == 'matched')
-        unmatched_items = total_items - matched_items
+        json_filename, txt_filename = unmatched_report_filenames(output_filename)
         
+        # Statistics from the counts kept by process_order
         statistics = {
-            'total_items': total_items,
-            'matched_items': matched_items,
-            'unmatched_items': unmatched_items,
+            'total_items': order_stats['total'],
+            'matched_items': order_stats['matched'],
+            'unmatched_items': order_stats['total'] - order_stats['matched'],
             'unmatched_summary': unmatched_tracker.get_summary()
         }
         
-        # Save to order history
-        order_id = db.save_order_to_history(customer_id, statistics, validated_orders, output_filename)
+        # Save to order history; ERP sheet, reports and order items are written in the background
+        order_id = db.create_order_history(customer_id, statistics, validated_orders, output_filename)
+        _submit_finalize(order_id, customer_id, validated_orders, unmatched_tracker, output_filename)
         
         return jsonify({
             'success': True,
             'customer_id': customer_id,
             'output_file': output_filename,
-            'unmatched_json': os.path.basename(json_report) if json_report else None,
-            'unmatched_txt': os.path.basename(txt_report) if txt_report else None,
+            'unmatched_json': json_filename,
+            'unmatched_txt': txt_filename,
             'order_id': order_id,
             'statistics': statistics,
-            'orders': validated_orders
+            **orders_response(validated_orders, order_id, data.get('include_orders'))
         })
     
     except Exception as e:
@@ -880,38 +1098,85 @@ def search_product():
     if not query:
         return jsonify({'results': []})
     
-    # Use the cached product matcher
-    all_products = product_cache.get_all_products()
-    product_names = [p['name'] for p in all_products]
-    
-    matches = process.extract(query, product_names, scorer=fuzz.token_sort_ratio, limit=10)
+    # Minimum score threshold of 60; names that cannot reach it are skipped
+    # Query is processed and token-sorted once, then compared with plain
+    # fuzz.ratio against the pre-sorted names (same scores as token_sort_ratio)
+    query = token_sort(utils.default_process(query))
+    product_names, sorted_names, candidates = product_cache.get_name_candidates(query, 60)
+    matches = process.extract(
+        query, [sorted_names[idx] for idx in candidates], scorer=fuzz.ratio,
+        processor=None, limit=10, score_cutoff=60
+    )
     
     results = []
     for match in matches:
-        if match[1] >= 60:  # Minimum score threshold
-            product_name = match[0]
-            articles = product_cache.get_articles_by_product(product_name)
-            
-            if articles:
-                results.append({
-                    'article_number': articles[0],
-                    'product_name': product_name,
-                    'score': match[1],
-                    'all_articles': articles
-                })
+        result = search_result(product_names[candidates[match[2]]], match[1])
+        if result:
+            results.append(result)
     
     return jsonify({'results': results})
 
 
+@app.route('/api/search-products-batch', methods=['POST'])
+def search_products_batch():
+    """Search the catalog for several queries in one request."""
+    try:
+        data = request.get_json()
+        queries = data.get('queries') if data else None
+        if not isinstance(queries, list):
+            return jsonify({'error': 'No queries provided'}), 400
+        
+        queries = [str(query) for query in queries]
+        product_names, sorted_names = product_cache.get_name_lists()
+        
+        # Same limit and minimum score as /api/search-product
+        all_matches = top_catalog_matches(
+            [token_sort(utils.default_process(query)) for query in queries], sorted_names,
+            limit=10, min_score=60
+        )
+        
+        batch_results = []
+        for query, matches in zip(queries, all_matches):
+            results = []
+            for idx, score in matches:
+                result = search_result(product_names[idx], score)
+                if result:
+                    results.append(result)
+            batch_results.append({'query': query, 'results': results})
+        
+        return jsonify({'results': batch_results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def search_result(product_name, score):
+    """Build a search result for a catalog name, or None if it has no article."""
+    articles = product_cache.articles_by_name.get(product_name)
+    if not articles:
+        return None
+    return {
+        'article_number': articles[0],
+        'product_name': product_name,
+        'score': round(score),
+        'all_articles': articles
+    }
+
+
 @app.route('/api/order-history', methods=['GET'])
 def get_order_history_endpoint():
     """Get order history with pagination."""
     try:
         limit = int(request.args.get('limit', 50))
         offset = int(request.args.get('offset', 0))
+        before_id = request.args.get('before_id', type=int)
         
-        orders = db.get_order_history(limit, offset)
-        return jsonify({'success': True, 'orders': orders})
+        orders = db.get_order_history(limit, offset, before_id)
+        return jsonify({
+            'success': True,
+            'orders': orders,
+            # Cursor for the next page, None on the last one
+            'next_before_id': orders[-1]['id'] if len(orders) == limit else None
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -929,6 +1194,51 @@ def get_order_details_endpoint(order_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/orders/<int:order_id>', methods=['GET'])
+def get_order_items_endpoint(order_id):
+    """
+    Page through the stored line items of a processed order. Items are only
+    returned once the order is 'completed'; see its status.
+    """
+    try:
+        limit = int(request.args.get('limit', ORDERS_PREVIEW_LIMIT))
+        offset = int(request.args.get('offset', 0))
+        
+        status = db.get_order_status(order_id)
+        if status is None:
+            return jsonify({'error': 'Order not found'}), 404
+        if status[0] == 'failed':
+            return jsonify({'error': status[1], 'status': 'failed'}), 500
+        
+        items = db.get_order_items(order_id, limit, offset) if status[0] == 'completed' else []
+        return jsonify({
+            'success': True,
+            'order_id': order_id,
+            'status': status[0],
+            'offset': offset,
+            'limit': limit,
+            'orders': items
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/orders/<int:order_id>/status', methods=['GET'])
+def get_order_status_endpoint(order_id):
+    """Report whether the ERP sheet, reports and items of an order have been written."""
+    try:
+        status = db.get_order_status(order_id)
+        if status is None:
+            return jsonify({'error': 'Order not found'}), 404
+        
+        response = {'success': True, 'order_id': order_id, 'status': status[0]}
+        if status[0] == 'failed':
+            response['error'] = status[1]
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/products', methods=['GET'])
 def get_products_endpoint():
     """Get all products from the database."""
@@ -956,12 +1266,9 @@ def add_product_endpoint():
         success, message = db.add_product(article_number, product_name, category, synonyms)
         
         if success:
-            # Refresh cache
-            refresh_product_cache()
-            
-            # Also add to CSV file
-            with open(PRODUCT_CATALOG_PATH, 'a') as f:
-                f.write(f'\n{article_number},{product_name}')
+            # Add to the CSV file, then extend the cache in place instead of reloading it
+            append_to_catalog(article_number, product_name)
+            product_cache.add_product(article_number, product_name, synonyms)
             
             return jsonify({'success': True, 'message': message})
         else:
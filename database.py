@@ -1,15 +1,132 @@
 import sqlite3
-import json
+import orjson
 from datetime import datetime
 import os
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
 
 DB_PATH = "order_processing.db"
 
+logger = logging.getLogger(__name__)
+
+# orjson options for JSON stored in text columns
+_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def _dumps(obj):
+    """Serialize obj to a JSON string with orjson."""
+    return orjson.dumps(obj, option=_JSON_OPTIONS).decode()
+
+# One long-lived read-only connection per thread, reused across requests
+_local = threading.local()
+
+# Prepared statements kept per connection. Chunked IN (...) queries compile
+# one statement per chunk size, which could push the fixed statements out of
+# sqlite3's default cache of 128
+_CACHED_STATEMENTS = 256
+
+# A single shared write connection; writers take _write_lock so each
+# transaction runs alone and commits with one WAL sync
+_write_lock = threading.Lock()
+_write_conn = None
+_write_path = None
+_write_pid = None
+
+# Connections inherited across fork() must not be used in the child, nor
+# closed there: closing runs SQLite's WAL cleanup against the parent's locks.
+# They are kept referenced here so they are never garbage collected.
+_forked_connections = []
+
+def _configure(conn):
+    """Apply the pragmas shared by read and write connections."""
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA cache_size=-65536')
+    conn.execute('PRAGMA temp_store=MEMORY')
+
+def get_connection():
+    """
+    Return this thread's read-only connection to DB_PATH, opening it on first
+    use in this process. Connections stay open so the page cache is kept warm
+    between calls; WAL lets them read while the write connection commits.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_PATH or _local.pid != os.getpid():
+        if conn is not None and _local.pid != os.getpid():
+            _forked_connections.append(conn)
+        conn = sqlite3.connect(DB_PATH, cached_statements=_CACHED_STATEMENTS)
+        _configure(conn)
+        conn.execute('PRAGMA query_only=1')
+        _local.conn, _local.path, _local.pid = conn, DB_PATH, os.getpid()
+    return conn
+
+@contextmanager
+def write_transaction():
+    """
+    Run a block of writes on the shared write connection as one
+    BEGIN IMMEDIATE transaction: committed on success, rolled back on error.
+    The connection is opened lazily in each process, so a forked worker never
+    writes through its parent's connection.
+    """
+    global _write_conn, _write_path, _write_pid
+    with _write_lock:
+        if _write_conn is not None and _write_pid != os.getpid():
+            _forked_connections.append(_write_conn)
+            _write_conn = None
+        if _write_conn is None or _write_path != DB_PATH:
+            # Autocommit mode, so transactions are only the ones begun below
+            _write_conn = sqlite3.connect(
+                DB_PATH, check_same_thread=False, isolation_level=None,
+                cached_statements=_CACHED_STATEMENTS
+            )
+            _configure(_write_conn)
+            _write_conn.execute('PRAGMA journal_mode=WAL')
+            _write_conn.execute('PRAGMA synchronous=NORMAL')
+            _write_path, _write_pid = DB_PATH, os.getpid()
+        
+        conn = _write_conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+def close_connections():
+    """
+    Close the write connection and this thread's read connection. Called in
+    the gunicorn master before forking, so workers start without any.
+    """
+    global _write_conn
+    with _write_lock:
+        if _write_conn is not None and _write_pid == os.getpid():
+            _write_conn.close()
+        _write_conn = None
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+def _fetch_dicts(cursor):
+    """
+    Return the remaining rows of an executed cursor as dicts, built straight
+    from the row tuples instead of through an intermediate sqlite3.Row list.
+    """
+    cursor.row_factory = None
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
 def init_database():
     """Initialize the database with required tables."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    with write_transaction() as conn:
+        _create_tables(conn.cursor())
+    print("Database initialized successfully!")
+
+def _create_tables(cursor):
+    """Create the tables and indexes that do not exist yet."""
     # Create order history table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS order_history (
@@ -21,10 +138,26 @@ def init_database():
             unmatched_items INTEGER,
             output_file TEXT,
             order_data TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'completed',
+            error TEXT
         )
     ''')
     
+    # Databases created before orders were finalized in the background
+    cursor.execute('PRAGMA table_info(order_history)')
+    history_columns = {row[1] for row in cursor.fetchall()}
+    if 'status' not in history_columns:
+        cursor.execute("ALTER TABLE order_history ADD COLUMN status TEXT DEFAULT 'completed'")
+    if 'error' not in history_columns:
+        cursor.execute('ALTER TABLE order_history ADD COLUMN error TEXT')
+    
+    # Downloads look up the order that produces a file
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_order_history_output_file
+        ON order_history(output_file)
+    ''')
+    
     # Create product catalog table with additional fields
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS products (
@@ -40,6 +173,59 @@ def init_database():
         )
     ''')
     
+    # Bumped by every change to products, so each worker process can tell
+    # when its in-memory product data (such as synonyms) is out of date
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO products_revision (id, revision) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS products_revision_{event.lower()}
+            AFTER {event} ON products
+            BEGIN
+                UPDATE products_revision SET revision = revision + 1 WHERE id = 1;
+            END
+        ''')
+    
+    # Synonym -> article join table, so a synonym lookup is one primary key
+    # seek instead of parsing every product's synonyms JSON; the synonyms
+    # column is kept as the per-product list
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_synonyms (
+            synonym TEXT PRIMARY KEY,
+            article_number TEXT NOT NULL,
+            FOREIGN KEY (article_number) REFERENCES products (article_number)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_product_synonyms_article
+        ON product_synonyms(article_number)
+    ''')
+    
+    # Fill it from the synonyms column of databases created before the table
+    cursor.execute('SELECT 1 FROM product_synonyms LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute('''
+            SELECT article_number, synonyms FROM products
+            WHERE synonyms IS NOT NULL
+            ORDER BY id
+        ''')
+        for article_number, synonyms in cursor.fetchall():
+            # A malformed row is skipped, as ProductCache.refresh does
+            try:
+                synonyms = orjson.loads(synonyms)
+            except orjson.JSONDecodeError:
+                logger.warning(f"Invalid synonyms JSON for {article_number}")
+                continue
+            if not isinstance(synonyms, list):
+                logger.warning(f"Synonyms of {article_number} are not a list")
+                continue
+            _insert_synonyms(cursor, article_number, synonyms)
+    
     # Create order items table for detailed tracking
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS order_items (
@@ -66,39 +252,81 @@ def init_database():
         )
     ''')
     
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully!")
+    # Lets the statistics query walk the top match counts instead of sorting
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_product_stats_match_count
+        ON product_stats(match_count DESC)
+    ''')
 
 def save_order_to_history(customer_id, statistics, orders, output_file):
     """Save processed order to history."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    # One transaction: committed on success, rolled back on error
+    with write_transaction() as conn:
+        cursor = conn.cursor()
+        order_id = _insert_order_header(cursor, customer_id, statistics, orders, output_file)
+        _insert_order_items(cursor, order_id, orders)
     
-    # Insert order history
+    return order_id
+
+def create_order_history(customer_id, statistics, orders, output_file):
+    """
+    Insert only the order history header, with status 'pending'; items are
+    added later with save_order_items, or the order is marked with mark_order_failed.
+    """
+    with write_transaction() as conn:
+        order_id = _insert_order_header(
+            conn.cursor(), customer_id, statistics, orders, output_file, status='pending'
+        )
+    
+    return order_id
+
+def save_order_items(order_id, orders):
+    """
+    Save the items and product statistics of an order created with
+    create_order_history and mark it 'completed'.
+    """
+    with write_transaction() as conn:
+        cursor = conn.cursor()
+        _insert_order_items(cursor, order_id, orders)
+        cursor.execute(
+            "UPDATE order_history SET status = 'completed' WHERE id = ?", (order_id,)
+        )
+
+def mark_order_failed(order_id, error):
+    """Mark a pending order as 'failed', keeping the error message for status polls."""
+    with write_transaction() as conn:
+        conn.execute(
+            "UPDATE order_history SET status = 'failed', error = ? WHERE id = ?",
+            (str(error), order_id)
+        )
+
+def _insert_order_header(cursor, customer_id, statistics, orders, output_file, status='completed'):
+    """Insert an order history row and return its id."""
     cursor.execute('''
         INSERT INTO order_history 
-        (customer_id, total_items, matched_items, unmatched_items, output_file, order_data)
-        VALUES (?, ?, ?, ?, ?, ?)
+        (customer_id, total_items, matched_items, unmatched_items, output_file, order_data, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
     ''', (
         customer_id,
         statistics['total_items'],
         statistics['matched_items'],
         statistics['unmatched_items'],
         output_file,
-        json.dumps(orders)
+        _dumps(orders),
+        status
     ))
     
-    order_id = cursor.lastrowid
-    
-    # Insert order items
-    for order in orders:
-        cursor.execute('''
-            INSERT INTO order_items
-            (order_id, original_product, matched_article, matched_product, 
-             quantity, match_score, match_method, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+    return cursor.lastrowid
+
+def _insert_order_items(cursor, order_id, orders):
+    """Insert order items and update product statistics."""
+    cursor.executemany('''
+        INSERT INTO order_items
+        (order_id, original_product, matched_article, matched_product, 
+         quantity, match_score, match_method, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (
             order_id,
             order.get('original_product'),
             order.get('matched_article'),
@@ -107,45 +335,52 @@ def save_order_to_history(customer_id, statistics, orders, output_file):
             order.get('match_score', 0),
             order.get('match_method'),
             order.get('status')
-        ))
-        
-        # Update product statistics
-        if order.get('status') == 'matched' and order.get('matched_article'):
-            cursor.execute('''
-                INSERT INTO product_stats (article_number, match_count, last_matched)
-                VALUES (?, 1, CURRENT_TIMESTAMP)
-                ON CONFLICT(article_number) DO UPDATE SET
-                    match_count = match_count + 1,
-                    last_matched = CURRENT_TIMESTAMP
-            ''', (order['matched_article'],))
-    
-    conn.commit()
-    conn.close()
+        )
+        for order in orders
+    ])
     
-    return order_id
+    # Update product statistics, one upsert per matched article
+    match_counts = Counter(
+        order['matched_article'] for order in orders
+        if order.get('status') == 'matched' and order.get('matched_article')
+    )
+    cursor.executemany('''
+        INSERT INTO product_stats (article_number, match_count, last_matched)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(article_number) DO UPDATE SET
+            match_count = match_count + excluded.match_count,
+            last_matched = CURRENT_TIMESTAMP
+    ''', match_counts.items())
 
-def get_order_history(limit=50, offset=0):
-    """Retrieve order history with pagination."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def get_order_history(limit=50, offset=0, before_id=None):
+    """
+    Retrieve order history, newest first.
+    Passing the last id of a page as before_id fetches the next page with a
+    primary key seek instead of skipping offset rows.
+    """
+    cursor = get_connection().cursor()
     
-    cursor.execute('''
-        SELECT * FROM order_history
-        ORDER BY timestamp DESC
-        LIMIT ? OFFSET ?
-    ''', (limit, offset))
+    if before_id is not None:
+        cursor.execute('''
+            SELECT * FROM order_history
+            WHERE id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (before_id, limit))
+    else:
+        cursor.execute('''
+            SELECT * FROM order_history
+            ORDER BY id DESC
+            LIMIT ? OFFSET ?
+        ''', (limit, offset))
     
-    orders = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    orders = _fetch_dicts(cursor)
     
     return orders
 
 def get_order_details(order_id):
     """Get detailed information about a specific order."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
     
     # Get order header
     cursor.execute('SELECT * FROM order_history WHERE id = ?', (order_id,))
@@ -153,38 +388,75 @@ def get_order_details(order_id):
     
     # Get order items
     cursor.execute('SELECT * FROM order_items WHERE order_id = ?', (order_id,))
-    order['items'] = [dict(row) for row in cursor.fetchall()]
+    order['items'] = _fetch_dicts(cursor)
     
-    conn.close()
     return order
 
+def get_order_status(order_id):
+    """
+    Get (status, error) of an order, or None if it does not exist.
+    Status is 'pending', 'completed' or 'failed'.
+    """
+    cursor = get_connection().cursor()
+    
+    cursor.execute('SELECT status, error FROM order_history WHERE id = ?', (order_id,))
+    row = cursor.fetchone()
+    
+    return (row[0], row[1]) if row else None
+
+def get_output_status(output_file):
+    """
+    Get (status, error) of the newest order writing output_file, or None if
+    no order does. Status is 'pending', 'completed' or 'failed'.
+    """
+    cursor = get_connection().cursor()
+    
+    cursor.execute('''
+        SELECT status, error FROM order_history
+        WHERE output_file = ?
+        ORDER BY id DESC
+        LIMIT 1
+    ''', (output_file,))
+    row = cursor.fetchone()
+    
+    return (row[0], row[1]) if row else None
+
+def get_order_items(order_id, limit=200, offset=0):
+    """Retrieve one page of an order's items, in insertion order."""
+    cursor = get_connection().cursor()
+    
+    cursor.execute('''
+        SELECT * FROM order_items
+        WHERE order_id = ?
+        ORDER BY id
+        LIMIT ? OFFSET ?
+    ''', (order_id, limit, offset))
+    
+    items = _fetch_dicts(cursor)
+    
+    return items
+
 def add_product(article_number, product_name, category=None, synonyms=None):
     """Add a new product to the catalog."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
-            INSERT INTO products (article_number, product_name, category, synonyms)
-            VALUES (?, ?, ?, ?)
-        ''', (article_number, product_name, category, json.dumps(synonyms) if synonyms else None))
+        with write_transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO products (article_number, product_name, category, synonyms)
+                VALUES (?, ?, ?, ?)
+            ''', (article_number, product_name, category, _dumps(synonyms) if synonyms else None))
+            if synonyms:
+                _insert_synonyms(cursor, article_number, synonyms)
         
-        conn.commit()
-        conn.close()
         return True, "Product added successfully"
     except sqlite3.IntegrityError:
-        conn.close()
         return False, "Product with this article number already exists"
     except Exception as e:
-        conn.close()
         return False, str(e)
 
 def update_product(article_number, product_name=None, category=None, 
                    is_available=None, is_discontinued=None, synonyms=None):
     """Update an existing product."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     updates = []
     params = []
     
@@ -202,72 +474,141 @@ def update_product(article_number, product_name=None, category=None,
         params.append(1 if is_discontinued else 0)
     if synonyms is not None:
         updates.append("synonyms = ?")
-        params.append(json.dumps(synonyms))
+        params.append(_dumps(synonyms))
     
     updates.append("updated_at = CURRENT_TIMESTAMP")
     params.append(article_number)
     
     query = f"UPDATE products SET {', '.join(updates)} WHERE article_number = ?"
-    cursor.execute(query, params)
-    
-    conn.commit()
-    conn.close()
+    with write_transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        if synonyms is not None and cursor.rowcount:
+            cursor.execute('DELETE FROM product_synonyms WHERE article_number = ?', (article_number,))
+            _insert_synonyms(cursor, article_number, synonyms)
     
     return True, "Product updated successfully"
 
+def _insert_synonyms(cursor, article_number, synonyms):
+    """
+    Add lowercased synonyms for an article to product_synonyms.
+    A synonym already taken by another article keeps its first article;
+    elements that are not strings are skipped.
+    """
+    cursor.executemany('''
+        INSERT OR IGNORE INTO product_synonyms (synonym, article_number)
+        VALUES (?, ?)
+    ''', [
+        (synonym.lower(), article_number) for synonym in synonyms
+        if isinstance(synonym, str)
+    ])
+
+def get_article_by_synonym(synonym):
+    """Get the article number for a synonym (case-insensitive), or None."""
+    cursor = get_connection().cursor()
+    
+    cursor.execute(
+        'SELECT article_number FROM product_synonyms WHERE synonym = ?', (synonym.lower(),)
+    )
+    row = cursor.fetchone()
+    article_number = row[0] if row else None
+    
+    return article_number
+
+def get_products_revision():
+    """Get the products revision counter, which changes whenever products does."""
+    cursor = get_connection().cursor()
+    
+    cursor.execute('SELECT revision FROM products_revision WHERE id = 1')
+    revision = cursor.fetchone()[0]
+    
+    return revision
+
 def get_all_products():
     """Get all products from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
     
     cursor.execute('SELECT * FROM products ORDER BY product_name')
-    products = [dict(row) for row in cursor.fetchall()]
+    products = _fetch_dicts(cursor)
     
-    conn.close()
     return products
 
 def get_product_by_article(article_number):
     """Get a specific product by article number."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
     
     cursor.execute('SELECT * FROM products WHERE article_number = ?', (article_number,))
     row = cursor.fetchone()
     product = dict(row) if row else None
     
-    conn.close()
     return product
 
+def get_products_by_articles(article_numbers):
+    """Get products for several article numbers at once, keyed by article number."""
+    article_numbers = list(dict.fromkeys(article_numbers))
+    products = {}
+    if not article_numbers:
+        return products
+    
+    cursor = get_connection().cursor()
+    
+    # Stay under SQLite's default limit of 999 bound parameters per statement
+    for start in range(0, len(article_numbers), 999):
+        chunk = article_numbers[start:start + 999]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'SELECT * FROM products WHERE article_number IN ({placeholders})', chunk)
+        for row in _fetch_dicts(cursor):
+            products[row['article_number']] = row
+    
+    return products
+
 def get_product_statistics():
     """Get statistics about product matching."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # Most matched products
-    cursor.execute('''
-        SELECT p.article_number, p.product_name, ps.match_count, ps.last_matched
-        FROM products p
-        LEFT JOIN product_stats ps ON p.article_number = ps.article_number
-        ORDER BY ps.match_count DESC
-        LIMIT 20
-    ''')
-    most_matched = [dict(row) for row in cursor.fetchall()]
+    cursor = get_connection().cursor()
     
-    # Never matched products
+    # Most matched and never matched products in one statement, tagged by bucket.
+    # The top counts come straight off idx_product_stats_match_count.
     cursor.execute('''
-        SELECT p.article_number, p.product_name
-        FROM products p
-        LEFT JOIN product_stats ps ON p.article_number = ps.article_number
-        WHERE ps.match_count IS NULL OR ps.match_count = 0
-        ORDER BY p.product_name
-        LIMIT 20
+        SELECT * FROM (
+            SELECT 'most_matched' AS bucket, p.article_number, p.product_name,
+                   ps.match_count, ps.last_matched
+            FROM product_stats ps
+            JOIN products p ON p.article_number = ps.article_number
+            ORDER BY ps.match_count DESC
+            LIMIT 20
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'never_matched', p.article_number, p.product_name,
+                   ps.match_count, ps.last_matched
+            FROM products p
+            LEFT JOIN product_stats ps ON p.article_number = ps.article_number
+            WHERE ps.match_count IS NULL OR ps.match_count = 0
+            ORDER BY p.product_name
+            LIMIT 20
+        )
     ''')
-    never_matched = [dict(row) for row in cursor.fetchall()]
     
-    conn.close()
+    most_matched = []
+    never_matched = []
+    for row in _fetch_dicts(cursor):
+        product = {
+            'article_number': row['article_number'],
+            'product_name': row['product_name'],
+            'match_count': row['match_count'],
+            'last_matched': row['last_matched']
+        }
+        if row['bucket'] == 'most_matched':
+            most_matched.append(product)
+        else:
+            never_matched.append({
+                'article_number': row['article_number'],
+                'product_name': row['product_name']
+            })
+            # Like the former LEFT JOIN ordering, pad the top list with
+            # products that have no matches
+            if len(most_matched) < 20:
+                most_matched.append(product)
     
     return {
         'most_matched': most_matched,
@@ -0,0 +1,27 @@
+"""
+Gunicorn configuration for serving the order processing backend.
+
+Usage:
+    gunicorn app:app
+"""
+
+import multiprocessing
+
+bind = "0.0.0.0:5000"
+
+# Load the app (database init, product catalog, output dir) once before forking;
+# workers then share the read-only catalog pages copy-on-write
+preload_app = True
+
+workers = multiprocessing.cpu_count()
+worker_class = "gthread"
+threads = 8
+
+# Large Excel orders with fuzzy matching can take a while
+timeout = 120
+
+
+def pre_fork(server, worker):
+    """Close the database connections opened while preloading; workers open their own."""
+    import database
+    database.close_connections()
@@ -0,0 +1,22 @@
+"""
+JSON Provider
+orjson-backed Flask JSON provider shared by app.py and app_improved.py
+"""
+
+from flask.json.provider import DefaultJSONProvider
+import orjson
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, keeping Flask's key order and type fallbacks."""
+    
+    option = (
+        orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        | orjson.OPT_PASSTHROUGH_DATETIME
+    )
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
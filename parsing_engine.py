@@ -3,11 +3,16 @@ Enhanced Order Parsing Engine
 Addresses all regex, quantity validation, and column detection issues
 """
 
+import os
 import re
 import logging
+import logging.handlers
+import queue
+import threading
 from typing import List, Dict, Tuple, Optional, Any
 from dataclasses import dataclass
 from enum import Enum
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +23,7 @@ class MatchMethod(Enum):
     """Enumeration of matching methods for auditing"""
     EXACT_ARTICLE = "exact_article"
     EXACT_PRODUCT = "exact_product"
+    PREFIX_ARTICLE = "prefix_article"
     FUZZY_ARTICLE = "fuzzy_article"
     FUZZY_PRODUCT = "fuzzy_product"
     SYNONYM_MATCH = "synonym_match"
@@ -54,6 +60,13 @@ class ParsedOrder:
 class QuantityValidator:
     """Handles all quantity validation logic"""
     
+    # Status codes returned by validate_array
+    OK = 0
+    NEGATIVE = 1
+    FRACTIONAL = 2
+    ZERO = 3
+    INVALID = 4
+    
     @staticmethod
     def validate(quantity: Any) -> Tuple[bool, int, List[str]]:
         """
@@ -65,44 +78,90 @@ class QuantityValidator:
         Returns:
             Tuple of (is_valid, cleaned_quantity, warnings)
         """
-        warnings = []
+        return QuantityValidator.validate_many([quantity])[0]
+    
+    @staticmethod
+    def validate_many(quantities: List[Any]) -> List[Tuple[bool, int, List[str]]]:
+        """
+        Validate a whole column of quantities in one vectorized pass.
         
-        try:
-            # Convert to float first to handle decimals
-            qty_float = float(quantity)
-            
-            # Check for negative numbers
-            if qty_float < 0:
-                return False, 0, ["Negative quantity is not allowed"]
-            
-            # Check for fractional quantities between 0 and 1
-            if 0 < qty_float < 1:
-                return False, 0, [f"Fractional quantity ({qty_float}) between 0 and 1 is invalid"]
-            
-            # Round decimal quantities
-            if qty_float != int(qty_float):
-                original_qty = qty_float
-                qty_float = round(qty_float)
-                warnings.append(f"{ParseWarning.DECIMAL_ROUNDED.value}: {original_qty} → {qty_float}")
-            
-            qty_int = int(qty_float)
-            
-            # Re-run zero check after rounding
-            if qty_int == 0:
-                return False, 0, ["Quantity cannot be zero (after rounding)"]
-            
-            # Check for unusually high quantities
-            if qty_int > 100:
-                warnings.append(f"{ParseWarning.HIGH_QUANTITY.value}: {qty_int}")
-            
-            # Check for unusually low quantities (but valid)
-            if 1 <= qty_int <= 2:
-                warnings.append(f"{ParseWarning.LOW_QUANTITY.value}: {qty_int}")
-            
-            return True, qty_int, warnings
+        Args:
+            quantities: The quantity values to validate
             
+        Returns:
+            One (is_valid, cleaned_quantity, warnings) tuple per quantity
+        """
+        codes, values, rounded = QuantityValidator.validate_array(quantities)
+        
+        results = []
+        for quantity, code, qty_float, qty_rounded in zip(
+            quantities, codes.tolist(), values.tolist(), rounded.tolist()
+        ):
+            if code == QuantityValidator.INVALID:
+                results.append((False, 0, [f"Invalid quantity format: {quantity}"]))
+            elif code == QuantityValidator.NEGATIVE:
+                results.append((False, 0, ["Negative quantity is not allowed"]))
+            elif code == QuantityValidator.FRACTIONAL:
+                results.append((False, 0, [f"Fractional quantity ({qty_float}) between 0 and 1 is invalid"]))
+            elif code == QuantityValidator.ZERO:
+                results.append((False, 0, ["Quantity cannot be zero (after rounding)"]))
+            else:
+                qty_int = int(qty_rounded)
+                warnings = []
+                if qty_float != qty_rounded:
+                    warnings.append(f"{ParseWarning.DECIMAL_ROUNDED.value}: {qty_float} → {qty_int}")
+                # Unusually high or low (but valid) quantities
+                if qty_int > 100:
+                    warnings.append(f"{ParseWarning.HIGH_QUANTITY.value}: {qty_int}")
+                if 1 <= qty_int <= 2:
+                    warnings.append(f"{ParseWarning.LOW_QUANTITY.value}: {qty_int}")
+                results.append((True, qty_int, warnings))
+        
+        return results
+    
+    @staticmethod
+    def validate_array(quantities: List[Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Classify quantities with NumPy array operations.
+        
+        Negatives and fractions between 0 and 1 are rejected, other decimals
+        are rounded half to even (like round()) and re-checked for zero.
+        
+        Returns:
+            Tuple of (uint8 status codes, float64 values, float64 rounded values)
+        """
+        values = quantities_to_float(quantities)
+        
+        finite = np.isfinite(values)
+        safe = np.where(finite, values, 0.0)
+        rounded = np.round(safe)
+        
+        # Assigned from lowest to highest precedence
+        codes = np.full(len(values), QuantityValidator.OK, dtype=np.uint8)
+        codes[rounded == 0] = QuantityValidator.ZERO
+        codes[(safe > 0) & (safe < 1)] = QuantityValidator.FRACTIONAL
+        codes[safe < 0] = QuantityValidator.NEGATIVE
+        codes[~finite] = QuantityValidator.INVALID
+        
+        return codes, values, rounded
+
+
+def quantities_to_float(quantities: List[Any]) -> np.ndarray:
+    """Convert raw quantity values to float64, NaN where float() would fail"""
+    try:
+        values = np.asarray(quantities, dtype=np.float64)
+        if values.shape == (len(quantities),):
+            return values
+    except (ValueError, TypeError):
+        pass
+    
+    values = np.full(len(quantities), np.nan)
+    for i, quantity in enumerate(quantities):
+        try:
+            values[i] = float(quantity)
         except (ValueError, TypeError):
-            return False, 0, [f"Invalid quantity format: {quantity}"]
+            pass
+    return values
 
 
 class RegexPatterns:
@@ -128,13 +187,31 @@ class RegexPatterns:
     )
     
     # Pattern 4: Product Name (Size/Color) - extract tokens
+    # Patterns 1-3 as one alternation, tried in the same priority order.
+    # The product/quantity branch splits at the last ',', ':' or tab, the
+    # way PRODUCT_QTY_DELIMITED matches are resolved.
+    ORDER_LINE = re.compile(
+        r'^(?:'
+        r'(?P<art>[A-Z0-9]+)\s*-\s*(?P<art_prod>.+?)[,:\s]+(?P<art_qty>\d+)\s*'
+        r'|(?P<prod>.+)[,:\t]\s*(?P<prod_qty>\d+)'
+        r'|(?P<qp_qty>\d+)\s*[x×]?\s*(?P<qp_prod>.+)'
+        r')$',
+        re.IGNORECASE
+    )
+    
+    # Two groups (bracketed text, size/color) so findall yields plain tuples
     SIZE_COLOR_TOKENS = re.compile(
-        r'\(([^)]+)\)|(\d+\.?\d*\s*mm)|(\d+\.?\d*")|'
-        r'(black|red|blue|green|white|yellow|orange|purple|pink|brown|grey|gray)',
+        r'\(([^)]+)\)|(\d+\.?\d*\s*mm|\d+\.?\d*"|'
+        r'black|red|blue|green|white|yellow|orange|purple|pink|brown|grey|gray)',
         re.IGNORECASE
     )
 
 
+def _keyword_pattern(keywords: List[str]) -> re.Pattern:
+    """Compile keywords into one alternation that matches any of them as a substring"""
+    return re.compile('|'.join(map(re.escape, keywords)))
+
+
 class ColumnDetector:
     """Improved column detection with preference for strong matches"""
     
@@ -148,6 +225,17 @@ class ColumnDetector:
     WEAK_ARTICLE_KEYWORDS = ['id', 'number', 'nr', 'no']
     WEAK_QUANTITY_KEYWORDS = ['count', 'num', 'pieces']
     
+    # One alternation per keyword list: a single regex scan per column and role
+    # (role, strong pattern, weak pattern)
+    _ROLE_PATTERNS = tuple(
+        (role, _keyword_pattern(strong), _keyword_pattern(weak))
+        for role, strong, weak in (
+            ('product_col', STRONG_PRODUCT_KEYWORDS, WEAK_PRODUCT_KEYWORDS),
+            ('article_col', STRONG_ARTICLE_KEYWORDS, WEAK_ARTICLE_KEYWORDS),
+            ('quantity_col', STRONG_QUANTITY_KEYWORDS, WEAK_QUANTITY_KEYWORDS),
+        )
+    )
+    
     @classmethod
     def detect_columns(cls, columns: List[str]) -> Dict[str, Optional[str]]:
         """
@@ -175,50 +263,14 @@ class ColumnDetector:
         for col in columns:
             col_lower = str(col).lower().strip()
             
-            # Check for product column
-            for keyword in cls.STRONG_PRODUCT_KEYWORDS:
-                if keyword in col_lower:
-                    if match_strength['product_col'] < 2:
-                        result['product_col'] = col
-                        match_strength['product_col'] = 2
-                    break
-            
-            if match_strength['product_col'] < 2:
-                for keyword in cls.WEAK_PRODUCT_KEYWORDS:
-                    if keyword in col_lower and match_strength['product_col'] < 1:
-                        result['product_col'] = col
-                        match_strength['product_col'] = 1
-                        break
-            
-            # Check for article column
-            for keyword in cls.STRONG_ARTICLE_KEYWORDS:
-                if keyword in col_lower:
-                    if match_strength['article_col'] < 2:
-                        result['article_col'] = col
-                        match_strength['article_col'] = 2
-                    break
-            
-            if match_strength['article_col'] < 2:
-                for keyword in cls.WEAK_ARTICLE_KEYWORDS:
-                    if keyword in col_lower and match_strength['article_col'] < 1:
-                        result['article_col'] = col
-                        match_strength['article_col'] = 1
-                        break
-            
-            # Check for quantity column
-            for keyword in cls.STRONG_QUANTITY_KEYWORDS:
-                if keyword in col_lower:
-                    if match_strength['quantity_col'] < 2:
-                        result['quantity_col'] = col
-                        match_strength['quantity_col'] = 2
-                    break
-            
-            if match_strength['quantity_col'] < 2:
-                for keyword in cls.WEAK_QUANTITY_KEYWORDS:
-                    if keyword in col_lower and match_strength['quantity_col'] < 1:
-                        result['quantity_col'] = col
-                        match_strength['quantity_col'] = 1
-                        break
+            for role, strong_pattern, weak_pattern in cls._ROLE_PATTERNS:
+                if strong_pattern.search(col_lower):
+                    if match_strength[role] < 2:
+                        result[role] = col
+                        match_strength[role] = 2
+                elif match_strength[role] < 1 and weak_pattern.search(col_lower):
+                    result[role] = col
+                    match_strength[role] = 1
         
         # Log detection results
         logger.info(f"Column detection: {result}")
@@ -252,56 +304,35 @@ class TextOrderParser:
             'regex_used': None
         }
         
-        # Try Pattern 1: Article Number - Product Name, Quantity
-        match = RegexPatterns.ARTICLE_PRODUCT_QTY.match(line)
+        # One pass over the line; lastgroup tells which pattern matched
+        match = RegexPatterns.ORDER_LINE.match(line)
         if match:
-            metadata['regex_used'] = 'ARTICLE_PRODUCT_QTY'
-            return {
-                'article_number': match.group(1).strip(),
-                'product_name': match.group(2).strip(),
-                'quantity': match.group(3),
-                'metadata': metadata
-            }
-        
-        # Try Pattern 2: Product Name, Quantity (with proper anchoring)
-        match = RegexPatterns.PRODUCT_QTY_DELIMITED.match(line)
-        if match:
-            product_part = match.group(1).strip()
-            quantity_part = match.group(2)
+            if match.lastgroup == 'art_qty':
+                # Pattern 1: Article Number - Product Name, Quantity
+                metadata['regex_used'] = 'ARTICLE_PRODUCT_QTY'
+                return {
+                    'article_number': match.group('art').strip(),
+                    'product_name': match.group('art_prod').strip(),
+                    'quantity': match.group('art_qty'),
+                    'metadata': metadata
+                }
             
-            # Additional validation: ensure the quantity isn't part of the product name
-            # Check if there's a clear delimiter before the quantity
-            if any(delim in line for delim in [',', ':', '\t']):
-                # Find the last delimiter
-                last_delim_pos = max(
-                    line.rfind(','),
-                    line.rfind(':'),
-                    line.rfind('\t')
-                )
-                
-                # Extract product and quantity based on delimiter
-                if last_delim_pos > 0:
-                    product_part = line[:last_delim_pos].strip()
-                    quantity_part = line[last_delim_pos + 1:].strip()
-                    
-                    # Verify quantity_part is purely numeric
-                    if quantity_part.isdigit():
-                        metadata['regex_used'] = 'PRODUCT_QTY_DELIMITED'
-                        return {
-                            'article_number': None,
-                            'product_name': product_part,
-                            'quantity': quantity_part,
-                            'metadata': metadata
-                        }
-        
-        # Try Pattern 3: Quantity x Product Name
-        match = RegexPatterns.QTY_PRODUCT.match(line)
-        if match:
+            if match.lastgroup == 'prod_qty':
+                # Pattern 2: Product Name, Quantity after the last delimiter
+                metadata['regex_used'] = 'PRODUCT_QTY_DELIMITED'
+                return {
+                    'article_number': None,
+                    'product_name': match.group('prod').strip(),
+                    'quantity': match.group('prod_qty'),
+                    'metadata': metadata
+                }
+            
+            # Pattern 3: Quantity x Product Name
             metadata['regex_used'] = 'QTY_PRODUCT'
             return {
                 'article_number': None,
-                'product_name': match.group(2).strip(),
-                'quantity': match.group(1),
+                'product_name': match.group('qp_prod').strip(),
+                'quantity': match.group('qp_qty'),
                 'metadata': metadata
             }
         
@@ -320,15 +351,47 @@ class TextOrderParser:
         Returns:
             List of extracted tokens
         """
-        tokens = []
-        matches = RegexPatterns.SIZE_COLOR_TOKENS.finditer(text)
-        
-        for match in matches:
-            for group in match.groups():
-                if group:
-                    tokens.append(group.lower().strip())
-        
-        return tokens
+        # Exactly one of the two groups is set (and non-empty) per match
+        return [
+            (bracketed or size_color).lower().strip()
+            for bracketed, size_color in RegexPatterns.SIZE_COLOR_TOKENS.findall(text)
+        ]
+
+
+# Parsing decisions go through a QueueHandler: the record is formatted on the
+# request thread, so it reflects the data at that point, and written out by a
+# QueueListener thread. The listener is started lazily in each process, since
+# a thread started before a fork does not exist in the child.
+_audit_logger = logging.getLogger(f"{__name__}.audit")
+_audit_logger.propagate = False
+_audit_lock = threading.Lock()
+_audit_pid = None
+
+
+class _ForwardHandler(logging.Handler):
+    """Hands records to a logger, so they reach its handlers and its parents'"""
+    
+    def __init__(self, target: logging.Logger):
+        super().__init__()
+        self.target = target
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        self.target.handle(record)
+
+
+def _get_audit_logger() -> logging.Logger:
+    """Return the parsing audit logger, starting this process's queue listener on first use"""
+    global _audit_pid
+    if _audit_pid != os.getpid():
+        with _audit_lock:
+            if _audit_pid != os.getpid():
+                audit_queue = queue.SimpleQueue()
+                for handler in list(_audit_logger.handlers):
+                    _audit_logger.removeHandler(handler)
+                _audit_logger.addHandler(logging.handlers.QueueHandler(audit_queue))
+                logging.handlers.QueueListener(audit_queue, _ForwardHandler(logger)).start()
+                _audit_pid = os.getpid()
+    return _audit_logger
 
 
 class ParsingAuditor:
@@ -348,6 +411,9 @@ class ParsingAuditor:
             result: Parsed order result
             context: Additional context information
         """
+        if not _audit_logger.isEnabledFor(logging.INFO):
+            return
+        
         log_entry = {
             'timestamp': context.get('timestamp'),
             'input': input_data,
@@ -364,7 +430,7 @@ class ParsingAuditor:
             'context': context
         }
         
-        logger.info(f"Parsing decision: {log_entry}")
+        _get_audit_logger().info("Parsing decision: %s", log_entry)
         
         # In production, this would write to a structured log file or database
         # For now, we'll just log to console
\ No newline at end of file
@@ -3,148 +3,467 @@ Enhanced Product Matching Engine
 Handles multi-candidate matching, caching, and synonym management
 """
 
-import json
+import orjson
 import logging
-from typing import List, Dict, Tuple, Optional, Set
+import re
+from typing import List, Dict, Tuple, Optional, Set, FrozenSet, NamedTuple
 from datetime import datetime
-from fuzzywuzzy import fuzz, process
+from rapidfuzz import fuzz, process, utils
 from collections import defaultdict
+import sys
 import threading
+import functools
+import bisect
+import heapq
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
+class Product(NamedTuple):
+    """One catalog row; the same record is shared by every cache map"""
+    article: str
+    name: str
+    tokens: FrozenSet[str]  # extract_tokens of name
+
+
+def _intern(value):
+    """
+    sys.intern strings entering the cache: the same article and name appear in
+    several maps, so they share one object and dict lookups compare by identity
+    """
+    return sys.intern(value) if type(value) is str else value
+
+
 class ProductCache:
     """Thread-safe cache for product data with refresh capability"""
     
     def __init__(self):
-        self._lock = threading.RLock()
+        # Serializes writers only (refresh, add_product, lazy pattern builds).
+        # Readers take no lock: every structure is either replaced whole by a
+        # single attribute assignment or only appended to, so a reader sees
+        # the state before or after a change, never a half-built one.
+        self._write_lock = threading.Lock()
         self._article_to_products = defaultdict(list)  # Article -> List of product variants
-        self._product_to_articles = defaultdict(list)  # Product -> List of article numbers
+        # Product -> List of article numbers; public so hot paths can read it
+        # without a method call
+        self.articles_by_name = defaultdict(list)
         self._synonym_map = {}  # Synonym -> (article, product, score)
         self._all_products = []
+        self._name_tokens = {}  # Product name -> extract_tokens set
+        self._sorted_articles = ()  # (upper-cased article, article), sorted for prefix lookups
+        # (names in catalog order, same names run through default_process with
+        # tokens sorted, character-presence mask, length and char_counts row
+        # per sorted name), replaced as one tuple
+        self._name_index = (
+            (), (), np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64),
+            np.zeros((0, CHAR_SLOTS), dtype=np.int16)
+        )
+        # (distinct articles in first-seen order, same articles run through
+        # default_process, character-presence mask and length per processed
+        # article), replaced as one tuple
+        self._article_index = ((), (), np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64))
         self._last_refresh = None
         self._version = 0
+        # (version, products, names), replaced whole on every change so
+        # readers can take it without a copy
+        self._snapshot = (0, (), ())
     
     def refresh(self, products_data: List[Dict], db_products: List[Dict]) -> None:
         """
         Refresh the cache with new product data.
         
+        Everything is built in locals and swapped in at the end, so to readers
+        a refresh is atomic per structure.
+        
         Args:
             products_data: List of products from CSV
             db_products: List of products from database with synonyms
         """
-        with self._lock:
-            self._article_to_products.clear()
-            self._product_to_articles.clear()
-            self._synonym_map.clear()
-            self._all_products = []
+        with self._write_lock:
+            article_to_products = defaultdict(list)
+            articles_by_name = defaultdict(list)
+            synonym_map = {}
+            name_tokens = {}
+            all_products = []
             
             # Build article -> products mapping (handles duplicates)
             for product in products_data:
-                article = product.get('Article Number')
-                name = product.get('Product')
+                article = _intern(product.get('Article Number'))
+                name = _intern(product.get('Product'))
                 
                 if article and name:
-                    self._article_to_products[article].append({
-                        'article': article,
-                        'name': name,
-                        'source': 'csv'
-                    })
-                    self._product_to_articles[name].append(article)
-                    self._all_products.append({
-                        'article': article,
-                        'name': name
-                    })
+                    record = Product(article, name, self._tokens_for(name_tokens, name))
+                    article_to_products[article].append(record)
+                    articles_by_name[name].append(article)
+                    all_products.append(record)
+            
+            # Names are normalized and token-sorted once here rather than on
+            # every fuzzy lookup
+            names = tuple(p.name for p in all_products)
+            sorted_names = tuple(
+                token_sort(utils.default_process(str(name))) for name in names
+            )
+            name_index = (
+                names,
+                sorted_names,
+                np.array([char_bitmask(name) for name in sorted_names], dtype=np.uint64),
+                np.array([len(name) for name in sorted_names], dtype=np.int64),
+                np.array(
+                    [char_counts(name) for name in sorted_names], dtype=np.int16
+                ).reshape(-1, CHAR_SLOTS)
+            )
+            
+            sorted_articles = tuple(sorted(
+                (str(article).strip().upper(), article)
+                for article in article_to_products
+            ))
+            
+            articles = tuple(article_to_products)
+            processed_articles = tuple(
+                utils.default_process(article) for article in articles
+            )
+            article_index = (
+                articles,
+                processed_articles,
+                np.array(
+                    [char_bitmask(article) for article in processed_articles], dtype=np.uint64
+                ),
+                np.array([len(article) for article in processed_articles], dtype=np.int64)
+            )
             
             # Build synonym map from database
             for db_product in db_products:
-                article = db_product.get('article_number')
-                name = db_product.get('product_name')
+                article = _intern(db_product.get('article_number'))
+                name = _intern(db_product.get('product_name'))
                 synonyms_json = db_product.get('synonyms')
                 
                 if synonyms_json:
                     try:
-                        synonyms = json.loads(synonyms_json)
-                        for synonym in synonyms:
-                            self._synonym_map[synonym.lower()] = {
-                                'article': article,
-                                'product': name,
-                                'score': 100
-                            }
-                    except json.JSONDecodeError:
+                        synonyms = orjson.loads(synonyms_json)
+                    except orjson.JSONDecodeError:
                         logger.warning(f"Invalid synonyms JSON for {article}")
+                        continue
+                    # One entry shared by all of this product's synonyms
+                    entry = {'article': article, 'product': name, 'score': 100}
+                    synonym_map.update(
+                        {_intern(synonym.lower()): entry for synonym in synonyms}
+                    )
+            
+            self._article_to_products = article_to_products
+            self.articles_by_name = articles_by_name
+            self._synonym_map = synonym_map
+            self._name_tokens = name_tokens
+            self._all_products = all_products
+            self._name_index = name_index
+            self._sorted_articles = sorted_articles
+            self._article_index = article_index
             
             self._last_refresh = datetime.now()
             self._version += 1
+            self._snapshot = (self._version, tuple(all_products), names)
+            
+            logger.info(f"Cache refreshed: {len(all_products)} products, "
+                       f"{len(synonym_map)} synonyms, version {self._version}")
+    
+    def add_product(self, article: str, name: str, synonyms: Optional[List[str]] = None) -> None:
+        """
+        Add one product without a full refresh: the lookup maps are appended
+        to, and the name/article indexes and sorted articles are replaced by
+        extended copies.
+        """
+        article, name = _intern(article), _intern(name)
+        with self._write_lock:
+            record = Product(article, name, self._tokens_for(self._name_tokens, name))
+            self._article_to_products[article].append(record)
+            self.articles_by_name[name].append(article)
+            self._all_products.append(record)
+            
+            # New tuples/arrays, so indexes handed out earlier stay consistent
+            names, sorted_names, masks, lengths, counts = self._name_index
+            sorted_name = token_sort(utils.default_process(str(name)))
+            self._name_index = (
+                names + (name,),
+                sorted_names + (sorted_name,),
+                np.append(masks, np.uint64(char_bitmask(sorted_name))),
+                np.append(lengths, len(sorted_name)),
+                np.vstack((counts, char_counts(sorted_name)))
+            )
             
-            logger.info(f"Cache refreshed: {len(self._all_products)} products, "
-                       f"{len(self._synonym_map)} synonyms, version {self._version}")
+            if len(self._article_to_products[article]) == 1:
+                key = (str(article).strip().upper(), article)
+                position = bisect.bisect_left(self._sorted_articles, key)
+                self._sorted_articles = (
+                    self._sorted_articles[:position] + (key,) + self._sorted_articles[position:]
+                )
+                
+                articles, processed_articles, masks, lengths = self._article_index
+                processed_article = utils.default_process(article)
+                self._article_index = (
+                    articles + (article,),
+                    processed_articles + (processed_article,),
+                    np.append(masks, np.uint64(char_bitmask(processed_article))),
+                    np.append(lengths, len(processed_article))
+                )
+            
+            for synonym in synonyms or []:
+                self._synonym_map[_intern(synonym.lower())] = {
+                    'article': article,
+                    'product': name,
+                    'score': 100
+                }
+            
+            self._version += 1
+            self._snapshot = (
+                self._version, self._snapshot[1] + (record,), self._name_index[0]
+            )
     
-    def get_products_by_article(self, article: str) -> List[Dict]:
+    @staticmethod
+    def _tokens_for(name_tokens: Dict[str, frozenset], name: str) -> frozenset:
+        """Size/color tokens of a product name, extracted once per distinct name"""
+        tokens = name_tokens.get(name)
+        if tokens is None:
+            tokens = name_tokens[name] = extract_tokens(name)
+        return tokens
+    
+    def get_name_tokens(self, name: str) -> frozenset:
+        """Get the precomputed size/color tokens of a catalog product name"""
+        tokens = self._name_tokens.get(name)
+        return tokens if tokens is not None else extract_tokens(name)
+    
+    def get_products_by_article(self, article: str) -> List[Product]:
         """Get all product variants for an article number"""
-        with self._lock:
-            return self._article_to_products.get(article, [])
+        return self._article_to_products.get(article, [])
     
     def get_articles_by_product(self, product: str) -> List[str]:
         """Get all article numbers for a product name"""
-        with self._lock:
-            return self._product_to_articles.get(product, [])
+        return self.articles_by_name.get(product, [])
     
-    def get_all_products(self) -> List[Dict]:
+    def get_all_products(self) -> List[Product]:
         """Get all products"""
-        with self._lock:
-            return self._all_products.copy()
+        return self._all_products.copy()
+    
+    def get_snapshot(self) -> Tuple[int, Tuple[Product, ...], Tuple[str, ...]]:
+        """
+        Get (version, products, product names) as one immutable snapshot.
+        The same tuple is shared by all readers until the next change, so
+        callers that only read should use this instead of get_all_products.
+        """
+        return self._snapshot
+    
+    def get_name_lists(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """Get (product names, processed token-sorted names) from the same refresh"""
+        names, sorted_names = self._name_index[:2]
+        return names, sorted_names
+    
+    def find_articles_by_prefix(self, prefix: str, limit: int = 2) -> List[str]:
+        """Get up to `limit` article numbers starting with prefix (case-insensitive)"""
+        key = prefix.strip().upper()
+        sorted_articles = self._sorted_articles
+        start = bisect.bisect_left(sorted_articles, (key,))
+        matches = []
+        for normalized, article in sorted_articles[start:start + limit]:
+            if not normalized.startswith(key):
+                break
+            matches.append(article)
+        return matches
+    
+    def get_name_candidates(
+        self, sorted_query: str, min_score: float
+    ) -> Tuple[Tuple[str, ...], Tuple[str, ...], List[int]]:
+        """
+        Get (product names, processed token-sorted names, candidate indices),
+        where the candidates are the names that can still reach min_score with
+        fuzz.ratio against the token-sorted query.
+        
+        Neither bound (see ratio_upper_bounds and char_count_upper_bounds)
+        ever rejects a name that would score min_score or more.
+        """
+        names, sorted_names, masks, lengths, counts = self._name_index
+        if not sorted_query:
+            return names, sorted_names, list(range(len(names)))
+        
+        # Cheap presence bound over the whole catalog, then the tighter
+        # per-character count bound over the survivors only
+        candidates = np.flatnonzero(ratio_upper_bounds(sorted_query, masks, lengths) >= min_score)
+        max_score = char_count_upper_bounds(sorted_query, counts[candidates], lengths[candidates])
+        return names, sorted_names, candidates[max_score >= min_score].tolist()
+    
+    def get_article_candidates(
+        self, processed_query: str, min_score: float
+    ) -> Tuple[Tuple[str, ...], Tuple[str, ...], List[int]]:
+        """
+        Get (articles, processed articles, candidate indices), where the
+        candidates are the articles that can still reach min_score with
+        fuzz.ratio against the processed query. Like get_name_candidates,
+        the bound never rejects an article that would score min_score or more.
+        """
+        articles, processed_articles, masks, lengths = self._article_index
+        if not processed_query:
+            return articles, processed_articles, list(range(len(articles)))
+        
+        max_score = ratio_upper_bounds(processed_query, masks, lengths)
+        return articles, processed_articles, np.flatnonzero(max_score >= min_score).tolist()
     
     def get_synonym_match(self, text: str) -> Optional[Dict]:
         """Check if text matches a known synonym"""
-        with self._lock:
-            return self._synonym_map.get(text.lower())
+        return self._synonym_map.get(text.lower())
     
     def get_cache_info(self) -> Dict:
         """Get cache statistics"""
-        with self._lock:
-            return {
-                'version': self._version,
-                'last_refresh': self._last_refresh.isoformat() if self._last_refresh else None,
-                'total_products': len(self._all_products),
-                'total_synonyms': len(self._synonym_map),
-                'unique_articles': len(self._article_to_products),
-                'unique_product_names': len(self._product_to_articles)
-            }
+        return {
+            'version': self._version,
+            'last_refresh': self._last_refresh.isoformat() if self._last_refresh else None,
+            'total_products': len(self._all_products),
+            'total_synonyms': len(self._synonym_map),
+            'unique_articles': len(self._article_to_products),
+            'unique_product_names': len(self.articles_by_name)
+        }
+
+
+def char_bitmask(text: str) -> int:
+    """
+    64-bit character-presence mask: one bit per letter and digit, the
+    remaining bits shared by all other non-space characters.
+    """
+    mask = 0
+    for char in set(text):
+        if 'a' <= char <= 'z':
+            mask |= 1 << (ord(char) - 97)
+        elif '0' <= char <= '9':
+            mask |= 1 << (ord(char) - 22)
+        elif not char.isspace():
+            mask |= 1 << (36 + ord(char) % 28)
+    return mask
+
+
+# Set bits per byte value, for popcount on NumPy < 2.0 (no np.bitwise_count)
+_BYTE_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """Number of set bits in each element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks)
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    return _BYTE_POPCOUNT[masks.view(np.uint8)].reshape(*masks.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+# Slots of char_counts: the 64 char_bitmask bits plus one for whitespace
+CHAR_SLOTS = 65
+
+
+def char_slot(char: str) -> int:
+    """Slot of a character in char_counts; matches its bit in char_bitmask"""
+    if 'a' <= char <= 'z':
+        return ord(char) - 97
+    if '0' <= char <= '9':
+        return ord(char) - 22
+    if char.isspace():
+        return 64
+    return 36 + ord(char) % 28
+
+
+def char_counts(text: str) -> np.ndarray:
+    """Per-slot character counts of text (a character-unigram profile)"""
+    return np.bincount([char_slot(char) for char in text], minlength=CHAR_SLOTS).astype(np.int16)
+
+
+def char_count_upper_bounds(query: str, counts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Upper bound of fuzz.ratio(query, s) for every string s given by its
+    char_counts row and length. A common subsequence uses each character at
+    most as often as the rarer side has it, so per slot the minimum of the
+    two counts bounds the longest common subsequence; sharing a slot between
+    characters only loosens the bound.
+    """
+    max_common = np.minimum(counts, char_counts(query)).sum(axis=1, dtype=np.int64)
+    return 200.0 * max_common / (len(query) + lengths)
+
+
+def ratio_upper_bounds(query: str, masks: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Upper bound of fuzz.ratio(query, s) for every string s given by its
+    char_bitmask and length. Characters present in only one of the two
+    strings must be deleted, which bounds the longest common subsequence
+    and therefore the score.
+    """
+    query_mask = np.uint64(char_bitmask(query))
+    query_only = popcount(query_mask & ~masks).astype(np.int64)
+    other_only = popcount(masks & ~query_mask).astype(np.int64)
+    max_common = np.minimum(len(query) - query_only, lengths - other_only)
+    return 200.0 * max_common / (len(query) + lengths)
+
+
+def token_sort(text: str) -> str:
+    """
+    The string fuzz.token_sort_ratio compares: sorted tokens joined by single
+    spaces. fuzz.ratio on two token-sorted processed strings gives the same score.
+    """
+    return ' '.join(sorted(text.split()))
+
+
+def top_catalog_matches(
+    sorted_queries: List[str], sorted_names: List[str], limit: int, min_score: float
+):
+    """
+    Score processed, token-sorted queries against the token-sorted catalog
+    names; fuzz.ratio on these equals fuzz.token_sort_ratio on the originals.
+    Scores are computed with one multi-threaded cdist call per chunk of queries.
+    Yields: one list of (name index, score) per query, best first
+    """
+    # Chunked to bound the score matrix to 256 x catalog size
+    for start in range(0, len(sorted_queries), 256):
+        scores = process.cdist(
+            sorted_queries[start:start + 256], sorted_names,
+            scorer=fuzz.ratio, processor=None,
+            score_cutoff=min_score, dtype=np.float64, workers=-1
+        )
+        for row in scores:
+            candidates = np.flatnonzero(row >= min_score)
+            if len(candidates) > limit:
+                # O(N) partition down to the scores tied with or above the k-th best
+                kth_score = np.partition(row[candidates], -limit)[-limit]
+                candidates = candidates[row[candidates] >= kth_score]
+            # Best scores first, ties in catalog order (same as process.extract)
+            top = candidates[np.argsort(-row[candidates], kind='stable')[:limit]]
+            yield [(idx, row[idx]) for idx in top.tolist()]
+
+
+# Sizes: "2.0 mm", "2.0mm", '2.0"' or "(2.0)", in one pass
+_SIZE_RE = re.compile(r'(\d+\.?\d*)\s*(?:mm|")|\((\d+\.?\d*)\)', re.IGNORECASE)
+
+# Colors found anywhere in the lowercased text, including overlapping ones
+_COLORS = ('black', 'red', 'blue', 'green', 'white', 'yellow',
+           'orange', 'purple', 'pink', 'brown', 'grey', 'gray')
+_COLOR_RE = re.compile('(?=(' + '|'.join(_COLORS) + '))')
+
+
+@functools.lru_cache(maxsize=16384)
+def extract_tokens(text: str) -> FrozenSet[str]:
+    """
+    Extract size/color tokens from product text. Memoized (bounded, since
+    inputs include customer text); the frozenset result is safe to share.
+    """
+    tokens = {mm_or_inch or bracketed for mm_or_inch, bracketed in _SIZE_RE.findall(text)}
+    tokens.update(_COLOR_RE.findall(text.lower()))
+    return frozenset(tokens)
+
+
+@functools.lru_cache(maxsize=16384)
+def _token_jaccard(tokens1: FrozenSet[str], tokens2: FrozenSet[str]) -> float:
+    """Jaccard similarity of two non-empty token sets, without building the union"""
+    common = len(tokens1 & tokens2)
+    return common / (len(tokens1) + len(tokens2) - common)
 
 
 class TokenMatcher:
     """Handles token-based matching for size/color variants"""
     
     @staticmethod
-    def extract_tokens(text: str) -> Set[str]:
+    def extract_tokens(text: str) -> FrozenSet[str]:
         """Extract meaningful tokens from product text"""
-        import re
-        
-        tokens = set()
-        
-        # Extract sizes (e.g., "2.0 mm", "2.0mm", "2.0")
-        size_patterns = [
-            r'(\d+\.?\d*)\s*mm',
-            r'(\d+\.?\d*)\s*"',
-            r'\((\d+\.?\d*)\)',
-        ]
-        
-        for pattern in size_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            tokens.update(m.lower() for m in matches)
-        
-        # Extract colors
-        colors = ['black', 'red', 'blue', 'green', 'white', 'yellow', 
-                 'orange', 'purple', 'pink', 'brown', 'grey', 'gray']
-        
-        text_lower = text.lower()
-        for color in colors:
-            if color in text_lower:
-                tokens.add(color)
-        
-        return tokens
+        return extract_tokens(text)
     
     @staticmethod
     def token_similarity(tokens1: Set[str], tokens2: Set[str]) -> float:
@@ -152,18 +471,26 @@ class TokenMatcher:
         if not tokens1 or not tokens2:
             return 0.0
         
-        intersection = tokens1.intersection(tokens2)
-        union = tokens1.union(tokens2)
-        
-        return len(intersection) / len(union) if union else 0.0
+        if isinstance(tokens1, frozenset) and isinstance(tokens2, frozenset):
+            # Commutative, so both argument orders share one cache entry
+            if hash(tokens1) > hash(tokens2):
+                tokens1, tokens2 = tokens2, tokens1
+            return _token_jaccard(tokens1, tokens2)
+        return _token_jaccard.__wrapped__(tokens1, tokens2)
 
 
 class EnhancedProductMatcher:
     """Enhanced product matcher with multi-candidate support and caching"""
     
+    # Shortest partial article number accepted for a prefix match
+    MIN_PREFIX_LENGTH = 5
+    
     def __init__(self, cache: ProductCache):
         self.cache = cache
         self.token_matcher = TokenMatcher()
+        # Repeated inputs skip the fuzzy pipeline; the cache version is part
+        # of the key, so results from before a refresh are never returned
+        self._lru = functools.lru_cache(maxsize=4096)(self._match_uncached)
     
     def match_product(
         self,
@@ -182,6 +509,21 @@ class EnhancedProductMatcher:
         Returns:
             Tuple of (matched_article, matched_product, score, method)
         """
+        return self._lru(input_product, input_article, threshold, self.cache.get_snapshot()[0])
+    
+    def _match_uncached(
+        self,
+        input_product: Optional[str],
+        input_article: Optional[str],
+        threshold: int,
+        version: int
+    ) -> Tuple[Optional[str], Optional[str], int, Optional[str]]:
+        """match_product without memoization; version only keys the LRU cache"""
+        
+        # Inputs are normalized once here; every fuzzy scorer below runs with
+        # processor=None (token-sorted product text equals token_sort_ratio)
+        sorted_product = token_sort(utils.default_process(input_product)) if input_product else ''
+        processed_article = utils.default_process(str(input_article)) if input_article else ''
         
         # Strategy 1: Exact article number match
         if input_article:
@@ -189,19 +531,19 @@ class EnhancedProductMatcher:
             if products:
                 # If multiple products for same article, try to disambiguate
                 if len(products) == 1:
-                    return (products[0]['article'], products[0]['name'], 
+                    return (products[0].article, products[0].name, 
                            100, 'exact_article')
                 elif input_product:
                     # Multiple candidates - use product name to choose best
                     best_match = self._choose_best_candidate(
-                        input_product, products
+                        sorted_product, products
                     )
                     if best_match:
-                        return (best_match['article'], best_match['name'],
+                        return (best_match.article, best_match.name,
                                100, 'exact_article_disambiguated')
                 else:
                     # No product name to disambiguate - return first
-                    return (products[0]['article'], products[0]['name'],
+                    return (products[0].article, products[0].name,
                            100, 'exact_article_first')
         
         # Strategy 2: Exact product name match (case-insensitive)
@@ -230,39 +572,69 @@ class EnhancedProductMatcher:
                 return (synonym_match['article'], synonym_match['product'],
                        synonym_match['score'], 'synonym_match')
         
-        # Strategy 4: Fuzzy article number match
+        # Strategy 4: Unique article number prefix (truncated or partial SKU),
+        # taken only if it scores at least threshold and agrees with the
+        # product name when one is given; otherwise strategies 5 and 6 decide
+        if input_article and len(str(input_article).strip()) >= self.MIN_PREFIX_LENGTH:
+            prefix_matches = self.cache.find_articles_by_prefix(str(input_article))
+            if len(prefix_matches) == 1:
+                products = self.cache.get_products_by_article(prefix_matches[0])
+                score = fuzz.ratio(
+                    processed_article, utils.default_process(prefix_matches[0])
+                )
+                name_agrees = not input_product or fuzz.ratio(
+                    sorted_product, token_sort(utils.default_process(products[0].name))
+                ) >= threshold
+                if score >= threshold and name_agrees:
+                    return (products[0].article, products[0].name,
+                           round(score), 'prefix_article')
+        
+        # Strategy 5: Fuzzy article number match, scoring only the articles
+        # whose character sets allow it
         if input_article:
-            all_articles = list(self.cache._article_to_products.keys())
-            if all_articles:
+            articles, processed_articles, candidates = self.cache.get_article_candidates(
+                processed_article, 85
+            )
+            if candidates:
                 best_match = process.extractOne(
-                    input_article, all_articles, scorer=fuzz.ratio
+                    processed_article, [processed_articles[idx] for idx in candidates],
+                    scorer=fuzz.ratio, processor=None, score_cutoff=85
                 )
-                if best_match and best_match[1] >= 85:
-                    products = self.cache.get_products_by_article(best_match[0])
+                if best_match:
+                    products = self.cache.get_products_by_article(
+                        articles[candidates[best_match[2]]]
+                    )
                     if products:
-                        return (products[0]['article'], products[0]['name'],
-                               best_match[1], 'fuzzy_article')
+                        return (products[0].article, products[0].name,
+                               round(best_match[1]), 'fuzzy_article')
         
-        # Strategy 5: Fuzzy product name match with token enhancement
+        # Strategy 6: Fuzzy product name match with token enhancement
         if input_product:
-            all_products = self.cache.get_all_products()
-            product_names = [p['name'] for p in all_products]
-            
-            # Get top fuzzy matches
-            matches = process.extract(
-                input_product, product_names, 
-                scorer=fuzz.token_sort_ratio, limit=5
+            # Get top fuzzy matches above the threshold, scoring only names
+            # whose character sets allow it
+            product_names, sorted_names, candidates = self.cache.get_name_candidates(
+                sorted_product, threshold
             )
+            # One cdist row over the candidates, top 5 picked in NumPy
+            matches = [
+                (candidates[i], score)
+                for i, score in next(top_catalog_matches(
+                    [sorted_product], [sorted_names[idx] for idx in candidates], 5, threshold
+                ))
+            ]
             
             if matches:
-                # Filter by threshold
-                valid_matches = [m for m in matches if m[1] >= threshold]
+                # Integer scores, ties kept in catalog order
+                valid_matches = [
+                    (product_names[idx], round(score))
+                    for idx, score in sorted(matches, key=lambda m: (-round(m[1]), m[0]))
+                ]
                 
                 if valid_matches:
                     # If we have multiple good matches, use token matching
                     if len(valid_matches) > 1:
                         best_match = self._enhance_with_tokens(
-                            input_product, valid_matches, all_products
+                            input_product, valid_matches
                         )
                     else:
                         best_match = valid_matches[0]
@@ -289,21 +661,24 @@ class EnhancedProductMatcher:
     
     def _choose_best_candidate(
         self, 
-        input_product: str, 
-        candidates: List[Dict]
-    ) -> Optional[Dict]:
-        """Choose best candidate from multiple products with same article"""
+        sorted_product: str, 
+        candidates: List[Product]
+    ) -> Optional[Product]:
+        """
+        Choose best candidate from multiple products with same article,
+        given the processed, token-sorted input product
+        """
         
         # Use fuzzy matching to find best name match
-        candidate_names = [c['name'] for c in candidates]
+        candidate_names = [
+            token_sort(utils.default_process(c.name)) for c in candidates
+        ]
         best_match = process.extractOne(
-            input_product, candidate_names, scorer=fuzz.token_sort_ratio
+            sorted_product, candidate_names, scorer=fuzz.ratio, processor=None
         )
         
         if best_match:
-            for candidate in candidates:
-                if candidate['name'] == best_match[0]:
-                    return candidate
+            return candidates[best_match[2]]
         
         return None
     
@@ -327,11 +702,8 @@ class EnhancedProductMatcher:
             products = self.cache.get_products_by_article(article)
             
             for product in products:
-                product_tokens = self.token_matcher.extract_tokens(
-                    product['name']
-                )
                 score = self.token_matcher.token_similarity(
-                    input_tokens, product_tokens
+                    input_tokens, product.tokens
                 )
                 
                 if score > best_score:
@@ -343,33 +715,30 @@ class EnhancedProductMatcher:
     def _enhance_with_tokens(
         self,
         input_product: str,
-        fuzzy_matches: List[Tuple[str, int]],
-        all_products: List[Dict]
+        fuzzy_matches: List[Tuple[str, int]]
     ) -> Tuple[str, int]:
         """Enhance fuzzy matches with token matching"""
         
         input_tokens = self.token_matcher.extract_tokens(input_product)
         
-        best_match = fuzzy_matches[0]
-        best_combined_score = fuzzy_matches[0][1]
+        fuzzy_scores = np.fromiter(
+            (score for _, score in fuzzy_matches), dtype=np.float64, count=len(fuzzy_matches)
+        )
+        token_scores = np.fromiter(
+            (self.token_matcher.token_similarity(input_tokens, self.cache.get_name_tokens(name))
+             for name, _ in fuzzy_matches),
+            dtype=np.float64, count=len(fuzzy_matches)
+        )
         
-        for match in fuzzy_matches:
-            product_name = match[0]
-            fuzzy_score = match[1]
-            
-            product_tokens = self.token_matcher.extract_tokens(product_name)
-            token_score = self.token_matcher.token_similarity(
-                input_tokens, product_tokens
-            )
-            
-            # Combined score: 70% fuzzy + 30% token
-            combined_score = (fuzzy_score * 0.7) + (token_score * 100 * 0.3)
-            
-            if combined_score > best_combined_score:
-                best_combined_score = combined_score
-                best_match = (product_name, int(combined_score))
+        # Combined score: 70% fuzzy + 30% token
+        combined_scores = (fuzzy_scores * 0.7) + (token_scores * 100 * 0.3)
         
-        return best_match
+        # The first match wins unless a combined score beats its fuzzy score;
+        # argmax picks the first of equal maxima, as the strict > loop did
+        best = int(combined_scores.argmax())
+        if combined_scores[best] > fuzzy_scores[0]:
+            return (fuzzy_matches[best][0], int(combined_scores[best]))
+        return fuzzy_matches[0]
 
 
 class SynonymManager:
@@ -377,7 +746,9 @@ class SynonymManager:
     
     def __init__(self, db_module):
         self.db = db_module
-        self.pending_synonyms = []  # Synonyms awaiting approval
+        # Synonyms awaiting approval, keyed by (synonym, article) so approving
+        # or rejecting one is a single pop; repeat suggestions replace the old one
+        self.pending_synonyms: Dict[Tuple[str, str], Dict] = {}
         self.usage_stats = defaultdict(int)  # Track synonym usage frequency
     
     def suggest_synonym(
@@ -408,7 +779,7 @@ class SynonymManager:
                 'status': 'pending'
             }
             
-            self.pending_synonyms.append(suggestion)
+            self.pending_synonyms[(original_text, matched_article)] = suggestion
             logger.info(f"Suggested synonym: {original_text} -> {matched_product}")
     
     def track_usage(self, synonym: str) -> None:
@@ -417,7 +788,7 @@ class SynonymManager:
     
     def get_pending_synonyms(self) -> List[Dict]:
         """Get all pending synonym suggestions"""
-        return self.pending_synonyms.copy()
+        return list(self.pending_synonyms.values())
     
     def approve_synonym(self, synonym: str, article: str) -> bool:
         """
@@ -441,8 +812,8 @@ class SynonymManager:
             existing_synonyms = []
             if product.get('synonyms'):
                 try:
-                    existing_synonyms = json.loads(product['synonyms'])
-                except json.JSONDecodeError:
+                    existing_synonyms = orjson.loads(product['synonyms'])
+                except orjson.JSONDecodeError:
                     pass
             
             # Add new synonym if not already present
@@ -456,10 +827,7 @@ class SynonymManager:
                 )
                 
                 # Remove from pending
-                self.pending_synonyms = [
-                    s for s in self.pending_synonyms 
-                    if s['synonym'] != synonym or s['article'] != article
-                ]
+                self.pending_synonyms.pop((synonym, article), None)
                 
                 logger.info(f"Approved synonym: {synonym} -> {article}")
                 return True
@@ -481,16 +849,7 @@ class SynonymManager:
         Returns:
             True if successful
         """
-        original_count = len(self.pending_synonyms)
-        
-        self.pending_synonyms = [
-            s for s in self.pending_synonyms 
-            if s['synonym'] != synonym or s['article'] != article
-        ]
-        
-        removed = original_count - len(self.pending_synonyms)
-        
-        if removed > 0:
+        if self.pending_synonyms.pop((synonym, article), None) is not None:
             logger.info(f"Rejected synonym: {synonym} -> {article}")
             return True
         
@@ -498,14 +857,11 @@ class SynonymManager:
     
     def get_usage_statistics(self) -> Dict:
         """Get synonym usage statistics"""
-        sorted_stats = sorted(
-            self.usage_stats.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
+        # Bounded top-20 selection instead of sorting every synonym
+        top_used = heapq.nlargest(20, self.usage_stats.items(), key=lambda x: x[1])
         
         return {
             'total_synonyms': len(self.usage_stats),
-            'top_used': sorted_stats[:20],
+            'top_used': top_used,
             'total_usage': sum(self.usage_stats.values())
         }
\ No newline at end of file
@@ -3,16 +3,29 @@ Product Versioning and Soft Deletion
 Maintains historical product information for audit trails
 """
 
-import json
+import sqlite3
+import orjson
 import logging
-from typing import List, Dict, Optional
+import functools
+from operator import attrgetter
+from typing import List, Dict, Optional, Tuple, Iterator, ClassVar, Set
 from datetime import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+def _parse_synonyms(value: Optional[str]) -> List[str]:
+    """Decode a stored synonyms JSON list, treating empty or invalid values as none"""
+    if not value:
+        return []
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError:
+        return []
+
+
+@dataclass(slots=True)
 class ProductVersion:
     """Represents a version of a product"""
     version_id: int
@@ -27,22 +40,108 @@ class ProductVersion:
     version_created_at: str
     change_reason: Optional[str]
     changed_by: Optional[str]
+    
+    @classmethod
+    def from_row(cls, row) -> 'ProductVersion':
+        """Build a version from a product_versions row in column order"""
+        return cls(*row[:6], _parse_synonyms(row[6]), *row[7:])
+    
+    def to_dict(self) -> Dict:
+        """Flat dict of the fields; a cheaper asdict for this flat class"""
+        values = dict(zip(_VERSION_COLUMNS, _get_version_fields(self)))
+        values['synonyms'] = list(self.synonyms)
+        return values
+
+
+# product_versions columns, in ProductVersion field order
+_VERSION_COLUMNS = tuple(field.name for field in fields(ProductVersion))
+_get_version_fields = attrgetter(*_VERSION_COLUMNS)
+_VERSION_SELECT = ', '.join(_VERSION_COLUMNS)
+
+_SQL_INSERT_VERSION = '''
+    INSERT INTO product_versions 
+    (article_number, product_name, category, is_available, 
+     is_discontinued, synonyms, created_at, updated_at, 
+     change_reason, changed_by)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# RETURNING (SQLite 3.35+) hands back the new version_id from the INSERT itself
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35)
+_SQL_INSERT_VERSION_RETURNING = _SQL_INSERT_VERSION + '    RETURNING version_id\n'
+
+_SQL_HISTORY = f'''
+    SELECT {_VERSION_SELECT} FROM product_versions
+    WHERE article_number = ?
+    ORDER BY version_created_at DESC, version_id DESC
+'''
+
+_SQL_AT_TIME = f'''
+    SELECT {_VERSION_SELECT} FROM product_versions
+    WHERE article_number = ? 
+    AND version_created_at <= ?
+    ORDER BY version_created_at DESC, version_id DESC
+    LIMIT 1
+'''
+
+# json_each raises on malformed JSON, so it only runs on valid values
+_SQL_WITH_SYNONYM = f'''
+    SELECT {_VERSION_SELECT} FROM product_versions
+    WHERE article_number = ?
+    AND CASE WHEN json_valid(synonyms) THEN json_type(synonyms) = 'array' AND EXISTS (
+        SELECT 1 FROM json_each(synonyms) WHERE lower(json_each.value) = ?
+    ) END
+    ORDER BY version_created_at DESC, version_id DESC
+'''
+
+_CHANGELOG_COLUMNS = (
+    'version_id', 'article_number', 'product_name',
+    'version_created_at', 'change_reason', 'changed_by'
+)
+
+_SQL_CHANGELOG = f'''
+    SELECT {', '.join(_CHANGELOG_COLUMNS)}
+    FROM product_versions
+    ORDER BY version_created_at DESC, version_id DESC
+    LIMIT ? OFFSET ?
+'''
 
 
 class ProductVersionManager:
     """Manages product versioning and soft deletion"""
     
+    # Database paths whose product_versions schema is already in place
+    _initialized_paths: ClassVar[Set[str]] = set()
+    
     def __init__(self, db_module):
         self.db = db_module
-        self._ensure_version_table()
+        if self.db.DB_PATH not in self._initialized_paths:
+            self._ensure_version_table()
+            self._initialized_paths.add(self.db.DB_PATH)
+        self._has_json1 = self._check_json1()
+        # Change log pages are cached under the newest version_id. Versions
+        # are only ever appended, so a write from any process changes the key.
+        self._change_log_page = functools.lru_cache(maxsize=32)(self._fetch_change_log)
     
     def _ensure_version_table(self) -> None:
         """Ensure the product_versions table exists"""
-        import sqlite3
-        
-        conn = sqlite3.connect(self.db.DB_PATH)
-        cursor = conn.cursor()
+        with self.db.write_transaction() as conn:
+            self._create_version_table(conn.cursor())
         
+        logger.info("Product versioning table initialized")
+    
+    def _check_json1(self) -> bool:
+        """Check whether SQLite was built with the JSON1 functions"""
+        try:
+            self.db.get_connection().execute("SELECT json('[]')")
+            return True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite JSON1 unavailable, synonym history filtered in Python")
+            return False
+    
+    @staticmethod
+    def _create_version_table(cursor) -> None:
+        """Create the product_versions table and its indexes"""
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS product_versions (
                 version_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -61,21 +160,27 @@ class ProductVersionManager:
             )
         ''')
         
-        # Create index for faster lookups
+        # Per-article history in time order, so history and point-in-time
+        # lookups are one index range scan with no sort. Walked backwards it
+        # yields version_created_at DESC, version_id DESC.
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_product_versions_article 
-            ON product_versions(article_number)
+            CREATE INDEX IF NOT EXISTS idx_pv_article_created
+            ON product_versions(article_number, version_created_at)
         ''')
         
+        # Superseded by the composite index above
+        cursor.execute('DROP INDEX IF EXISTS idx_product_versions_article')
+        
+        # Covers every change log column, so a page is read from the index
+        # alone, newest first, without visiting the table
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_product_versions_created 
-            ON product_versions(version_created_at)
+            CREATE INDEX IF NOT EXISTS idx_pv_changelog
+            ON product_versions(version_created_at, version_id, article_number,
+                                product_name, change_reason, changed_by)
         ''')
         
-        conn.commit()
-        conn.close()
-        
-        logger.info("Product versioning table initialized")
+        # Superseded by the covering index above
+        cursor.execute('DROP INDEX IF EXISTS idx_product_versions_created')
     
     def create_version(
         self,
@@ -94,8 +199,6 @@ class ProductVersionManager:
         Returns:
             Version ID
         """
-        import sqlite3
-        
         # Get current product state
         product = self.db.get_product_by_article(article_number)
         
@@ -103,16 +206,29 @@ class ProductVersionManager:
             logger.error(f"Product {article_number} not found")
             return -1
         
-        conn = sqlite3.connect(self.db.DB_PATH)
-        cursor = conn.cursor()
+        with self.db.write_transaction() as conn:
+            cursor = conn.cursor()
+            params = self._version_params(product, change_reason, changed_by)
+            
+            if _HAS_RETURNING:
+                cursor.execute(_SQL_INSERT_VERSION_RETURNING, params)
+                version_id = cursor.fetchone()[0]
+            else:
+                cursor.execute(_SQL_INSERT_VERSION, params)
+                version_id = cursor.lastrowid
+        
+        logger.info(f"Created version {version_id} for product {article_number}")
         
-        cursor.execute('''
-            INSERT INTO product_versions 
-            (article_number, product_name, category, is_available, 
-             is_discontinued, synonyms, created_at, updated_at, 
-             change_reason, changed_by)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        return version_id
+    
+    @staticmethod
+    def _version_params(
+        product: Dict,
+        change_reason: Optional[str],
+        changed_by: Optional[str]
+    ) -> tuple:
+        """Build the product_versions INSERT parameters for a product row"""
+        return (
             product['article_number'],
             product['product_name'],
             product.get('category'),
@@ -123,16 +239,48 @@ class ProductVersionManager:
             product.get('updated_at'),
             change_reason,
             changed_by
-        ))
+        )
+    
+    def create_versions(
+        self,
+        article_numbers: List[str],
+        change_reason: Optional[str] = None,
+        changed_by: Optional[str] = None
+    ) -> int:
+        """
+        Create versions of several products in a single transaction.
         
-        version_id = cursor.lastrowid
+        Args:
+            article_numbers: The article numbers
+            change_reason: Reason for the change
+            changed_by: User who made the change
+            
+        Returns:
+            Number of versions created
+        """
+        products = self._get_existing_products(article_numbers)
+        if not products:
+            return 0
         
-        conn.commit()
-        conn.close()
+        with self.db.write_transaction() as conn:
+            conn.executemany(_SQL_INSERT_VERSION, [
+                self._version_params(product, change_reason, changed_by)
+                for product in products.values()
+            ])
         
-        logger.info(f"Created version {version_id} for product {article_number}")
+        logger.info(f"Created versions for {len(products)} products")
         
-        return version_id
+        return len(products)
+    
+    def _get_existing_products(self, article_numbers: List[str]) -> Dict[str, Dict]:
+        """Fetch products by article number, logging the ones not found"""
+        products = self.db.get_products_by_articles(article_numbers)
+        
+        for article_number in article_numbers:
+            if article_number not in products:
+                logger.error(f"Product {article_number} not found")
+        
+        return products
     
     def get_product_history(
         self,
@@ -147,36 +295,63 @@ class ProductVersionManager:
         Returns:
             List of product versions
         """
-        import sqlite3
-        
-        conn = sqlite3.connect(self.db.DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        return list(self.iter_product_history(article_number))
+    
+    def iter_product_history(
+        self,
+        article_number: str
+    ) -> Iterator[ProductVersion]:
+        """
+        Iterate over the history of a product, newest first, fetching rows
+        in batches so long histories are never held in memory at once.
         
-        cursor.execute('''
-            SELECT * FROM product_versions
-            WHERE article_number = ?
-            ORDER BY version_created_at DESC
-        ''', (article_number,))
-        
-        versions = []
-        for row in cursor.fetchall():
-            row_dict = dict(row)
+        Args:
+            article_number: The article number
             
-            # Parse synonyms
-            if row_dict.get('synonyms'):
-                try:
-                    row_dict['synonyms'] = json.loads(row_dict['synonyms'])
-                except json.JSONDecodeError:
-                    row_dict['synonyms'] = []
-            else:
-                row_dict['synonyms'] = []
+        Yields:
+            Product versions
+        """
+        cursor = self.db.get_connection().cursor()
+        cursor.row_factory = None
+        cursor.arraysize = 256
+        
+        cursor.execute(_SQL_HISTORY, (article_number,))
+        
+        while rows := cursor.fetchmany():
+            for row in rows:
+                yield ProductVersion.from_row(row)
+    
+    def find_versions_with_synonym(
+        self,
+        article_number: str,
+        synonym: str
+    ) -> List[ProductVersion]:
+        """
+        Get the versions of a product whose synonyms included a synonym,
+        filtering the synonyms JSON inside SQLite when JSON1 is available.
+        
+        Args:
+            article_number: The article number
+            synonym: Synonym to look for, case-insensitive
             
-            versions.append(ProductVersion(**row_dict))
+        Returns:
+            List of product versions, newest first
+        """
+        synonym = synonym.lower()
+        
+        if not self._has_json1:
+            return [
+                version for version in self.iter_product_history(article_number)
+                if isinstance(version.synonyms, list)
+                and any(str(value).lower() == synonym for value in version.synonyms)
+            ]
+        
+        cursor = self.db.get_connection().cursor()
+        cursor.row_factory = None
         
-        conn.close()
+        cursor.execute(_SQL_WITH_SYNONYM, (article_number, synonym))
         
-        return versions
+        return [ProductVersion.from_row(row) for row in cursor.fetchall()]
     
     def get_product_at_time(
         self,
@@ -193,39 +368,19 @@ class ProductVersionManager:
         Returns:
             Product version at that time or None
         """
-        import sqlite3
-        
-        conn = sqlite3.connect(self.db.DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM product_versions
-            WHERE article_number = ? 
-            AND version_created_at <= ?
-            ORDER BY version_created_at DESC
-            LIMIT 1
-        ''', (article_number, timestamp))
+        cursor = self.db.get_connection().cursor()
+        cursor.row_factory = None
         
+        cursor.execute(_SQL_AT_TIME, (article_number, timestamp))
         row = cursor.fetchone()
         
-        if row:
-            row_dict = dict(row)
-            
-            # Parse synonyms
-            if row_dict.get('synonyms'):
-                try:
-                    row_dict['synonyms'] = json.loads(row_dict['synonyms'])
-                except json.JSONDecodeError:
-                    row_dict['synonyms'] = []
-            else:
-                row_dict['synonyms'] = []
-            
-            conn.close()
-            return ProductVersion(**row_dict)
-        
-        conn.close()
-        return None
+        return ProductVersion.from_row(row) if row else None
+    
+    def _last_version_id(self) -> Optional[int]:
+        """Newest version_id; versions are append-only, so any write changes it"""
+        cursor = self.db.get_connection().cursor()
+        cursor.execute('SELECT MAX(version_id) FROM product_versions')
+        return cursor.fetchone()[0]
     
     def soft_delete_product(
         self,
@@ -244,24 +399,13 @@ class ProductVersionManager:
         Returns:
             True if successful
         """
-        # Create version before deletion
-        self.create_version(
-            article_number,
-            change_reason=f"Soft deletion: {reason}" if reason else "Soft deletion",
-            changed_by=deleted_by
-        )
-        
-        # Mark as discontinued and unavailable
-        success, message = self.db.update_product(
-            article_number,
-            is_available=False,
-            is_discontinued=True
-        )
+        # Version and mark as discontinued and unavailable in one transaction
+        success = self.soft_delete_products([article_number], reason, deleted_by) == 1
         
         if success:
             logger.info(f"Soft deleted product {article_number}")
         else:
-            logger.error(f"Failed to soft delete product {article_number}: {message}")
+            logger.error(f"Failed to soft delete product {article_number}: not found")
         
         return success
     
@@ -282,27 +426,103 @@ class ProductVersionManager:
         Returns:
             True if successful
         """
-        # Create version before restoration
-        self.create_version(
-            article_number,
-            change_reason=f"Restoration: {reason}" if reason else "Restoration",
-            changed_by=restored_by
-        )
-        
-        # Mark as available and not discontinued
-        success, message = self.db.update_product(
-            article_number,
-            is_available=True,
-            is_discontinued=False
-        )
+        # Version and mark as available and not discontinued in one transaction
+        success = self.restore_products([article_number], reason, restored_by) == 1
         
         if success:
             logger.info(f"Restored product {article_number}")
         else:
-            logger.error(f"Failed to restore product {article_number}: {message}")
+            logger.error(f"Failed to restore product {article_number}: not found")
         
         return success
     
+    def soft_delete_products(
+        self,
+        article_numbers: List[str],
+        reason: Optional[str] = None,
+        deleted_by: Optional[str] = None
+    ) -> int:
+        """
+        Soft delete several products, versioning and updating them all in
+        one transaction.
+        
+        Args:
+            article_numbers: The article numbers
+            reason: Reason for deletion
+            deleted_by: User who deleted them
+            
+        Returns:
+            Number of products soft deleted
+        """
+        return self._set_products_status(
+            article_numbers,
+            is_available=False,
+            is_discontinued=True,
+            change_reason=f"Soft deletion: {reason}" if reason else "Soft deletion",
+            changed_by=deleted_by
+        )
+    
+    def restore_products(
+        self,
+        article_numbers: List[str],
+        reason: Optional[str] = None,
+        restored_by: Optional[str] = None
+    ) -> int:
+        """
+        Restore several soft-deleted products in one transaction.
+        
+        Args:
+            article_numbers: The article numbers
+            reason: Reason for restoration
+            restored_by: User who restored them
+            
+        Returns:
+            Number of products restored
+        """
+        return self._set_products_status(
+            article_numbers,
+            is_available=True,
+            is_discontinued=False,
+            change_reason=f"Restoration: {reason}" if reason else "Restoration",
+            changed_by=restored_by
+        )
+    
+    def _set_products_status(
+        self,
+        article_numbers: List[str],
+        is_available: bool,
+        is_discontinued: bool,
+        change_reason: str,
+        changed_by: Optional[str]
+    ) -> int:
+        """Version the products and set their status flags in one transaction"""
+        products = self._get_existing_products(article_numbers)
+        if not products:
+            return 0
+        
+        articles = list(products)
+        with self.db.write_transaction() as conn:
+            conn.executemany(_SQL_INSERT_VERSION, [
+                self._version_params(product, change_reason, changed_by)
+                for product in products.values()
+            ])
+            
+            # Two status parameters plus each chunk stay under SQLite's
+            # default limit of 999 bound parameters per statement
+            for start in range(0, len(articles), 997):
+                chunk = articles[start:start + 997]
+                placeholders = ','.join('?' * len(chunk))
+                conn.execute(f'''
+                    UPDATE products
+                    SET is_available = ?, is_discontinued = ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE article_number IN ({placeholders})
+                ''', [int(is_available), int(is_discontinued), *chunk])
+        
+        logger.info(f"Updated status of {len(articles)} products ({change_reason})")
+        
+        return len(articles)
+    
     def get_change_log(
         self,
         limit: int = 50,
@@ -318,30 +538,19 @@ class ProductVersionManager:
         Returns:
             List of change records
         """
-        import sqlite3
+        page = self._change_log_page(limit, offset, self._last_version_id())
         
-        conn = sqlite3.connect(self.db.DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        # Copies, so callers cannot modify the cached page
+        return [dict(change) for change in page]
+    
+    def _fetch_change_log(self, limit: int, offset: int, last_version_id: Optional[int]) -> tuple:
+        """Query one change log page; last_version_id only keys the cache"""
+        cursor = self.db.get_connection().cursor()
+        cursor.row_factory = None
         
-        cursor.execute('''
-            SELECT 
-                version_id,
-                article_number,
-                product_name,
-                version_created_at,
-                change_reason,
-                changed_by
-            FROM product_versions
-            ORDER BY version_created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (limit, offset))
-        
-        changes = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
-        
-        return changes
+        cursor.execute(_SQL_CHANGELOG, (limit, offset))
+        
+        return tuple(dict(zip(_CHANGELOG_COLUMNS, row)) for row in cursor)
     
     def explain_old_order(
         self,
@@ -358,44 +567,101 @@ class ProductVersionManager:
         Returns:
             Dictionary with explanation
         """
-        # Get product state at order time
-        historical_product = self.get_product_at_time(
-            article_number,
-            order_timestamp
-        )
-        
-        # Get current product state
-        current_product = self.db.get_product_by_article(article_number)
+        return self.explain_old_orders([(article_number, order_timestamp)])[0]
+    
+    def explain_old_orders(
+        self,
+        orders: List[Tuple[str, str]]
+    ) -> List[Dict]:
+        """
+        Explain several old orders, fetching the product state at each order
+        time and the current product state in one query.
         
+        Args:
+            orders: (article_number, order_timestamp) pairs
+            
+        Returns:
+            List of explanations, in the same order as orders
+        """
+        cursor = self.db.get_connection().cursor()
+        cursor.row_factory = None
+        version_columns = ', '.join(f'v.{column}' for column in _VERSION_COLUMNS)
+        current_start = 1 + len(_VERSION_COLUMNS)
+        explanations = []
+        
+        # Three parameters per order stay under SQLite's default limit of 999
+        for start in range(0, len(orders), 333):
+            chunk = orders[start:start + 333]
+            values = ', '.join(['(?, ?, ?)'] * len(chunk))
+            params = [
+                value
+                for position, (article_number, order_timestamp) in enumerate(chunk)
+                for value in (position, article_number, order_timestamp)
+            ]
+            
+            # Latest version at or before each order time, picked the same
+            # way as in get_product_at_time, next to the current product row
+            cursor.execute(f'''
+                WITH orders(position, article_number, order_timestamp) AS (
+                    VALUES {values}
+                )
+                SELECT o.position, {version_columns}, p.*
+                FROM orders o
+                LEFT JOIN product_versions v ON v.version_id = (
+                    SELECT version_id FROM product_versions
+                    WHERE article_number = o.article_number
+                    AND version_created_at <= o.order_timestamp
+                    ORDER BY version_created_at DESC, version_id DESC
+                    LIMIT 1
+                )
+                LEFT JOIN products p ON p.article_number = o.article_number
+                ORDER BY o.position
+            ''', params)
+            
+            product_columns = [column[0] for column in cursor.description[current_start:]]
+            article_index = product_columns.index('article_number')
+            
+            for (article_number, order_timestamp), row in zip(chunk, cursor.fetchall()):
+                historical_product = None
+                if row[1] is not None:
+                    historical_product = ProductVersion.from_row(row[1:current_start])
+                
+                current_product = None
+                if row[current_start + article_index] is not None:
+                    current_product = dict(zip(product_columns, row[current_start:]))
+                
+                explanations.append(self._build_explanation(
+                    article_number, order_timestamp,
+                    historical_product, current_product
+                ))
+        
+        return explanations
+    
+    @staticmethod
+    def _build_explanation(
+        article_number: str,
+        order_timestamp: str,
+        historical_product: Optional[ProductVersion],
+        current_product: Optional[Dict]
+    ) -> Dict:
+        """Describe how a product changed between an order and now"""
         explanation = {
             'article_number': article_number,
             'order_timestamp': order_timestamp,
-            'historical_state': asdict(historical_product) if historical_product else None,
+            'historical_state': historical_product.to_dict() if historical_product else None,
             'current_state': current_product,
             'changes': []
         }
         
         # Identify changes
         if historical_product and current_product:
-            if historical_product.product_name != current_product['product_name']:
-                explanation['changes'].append({
-                    'field': 'product_name',
-                    'old_value': historical_product.product_name,
-                    'new_value': current_product['product_name']
-                })
-            
-            if historical_product.is_available != current_product['is_available']:
-                explanation['changes'].append({
-                    'field': 'is_available',
-                    'old_value': historical_product.is_available,
-                    'new_value': current_product['is_available']
-                })
-            
-            if historical_product.is_discontinued != current_product['is_discontinued']:
-                explanation['changes'].append({
-                    'field': 'is_discontinued',
-                    'old_value': historical_product.is_discontinued,
-                    'new_value': current_product['is_discontinued']
-                })
-        
-        return explanation
\ No newline at end of file
+            for field_name in ('product_name', 'is_available', 'is_discontinued'):
+                old_value = getattr(historical_product, field_name)
+                if old_value != current_product[field_name]:
+                    explanation['changes'].append({
+                        'field': field_name,
+                        'old_value': old_value,
+                        'new_value': current_product[field_name]
+                    })
+        
+        return explanation
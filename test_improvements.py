@@ -12,11 +12,12 @@ from datetime import datetime
 # Import modules to test
 from parsing_engine import (
     QuantityValidator, RegexPatterns, ColumnDetector,
-    TextOrderParser, TokenMatcher
+    TextOrderParser
 )
 from product_matcher import ProductCache, EnhancedProductMatcher, TokenMatcher as PMTokenMatcher
 from unmatched_tracker import UnmatchedTracker, UnmatchedReason
 from product_versioning import ProductVersionManager
+import database
 
 
 class TestQuantityValidator(unittest.TestCase):
@@ -65,6 +66,14 @@ class TestQuantityValidator(unittest.TestCase):
         self.assertTrue(is_valid)
         self.assertEqual(qty, 1)
         self.assertTrue(any("low_quantity" in w for w in warnings))
+    
+    def test_validate_many_matches_validate(self):
+        """Test that batch validation gives the same results as per-value validation"""
+        quantities = [3, '4', 2.5, 0.5, -1, 0, 'abc', None, 150, float('inf')]
+        results = QuantityValidator.validate_many(quantities)
+        self.assertEqual(results, [QuantityValidator.validate(q) for q in quantities])
+        self.assertEqual(results[2], (True, 2, ["decimal_rounded: 2.5 → 2", "low_quantity: 2"]))
+        self.assertFalse(results[-1][0])
 
 
 class TestRegexPatterns(unittest.TestCase):
@@ -206,6 +215,22 @@ class TestProductCache(unittest.TestCase):
         synonym_match = self.cache.get_synonym_match('r9 black')
         self.assertIsNotNone(synonym_match)
         self.assertEqual(synonym_match['article'], '12345')
+
+    def test_add_product_in_place(self):
+        """Test that a single added product is found without a refresh"""
+        self.cache.add_product('12348', 'Tenergy 05 Red 2.1mm', ['T05 Red'])
+        self.assertEqual(self.cache.get_articles_by_product('Tenergy 05 Red 2.1mm'), ['12348'])
+        self.assertEqual(self.cache.get_synonym_match('t05 red')['article'], '12348')
+        self.assertEqual(self.cache.find_articles_by_prefix('1234'), ['12345', '12346'])
+        
+        names, sorted_names, candidates = self.cache.get_name_candidates('05 1mm 2 red tenergy', 80)
+        self.assertEqual(len(names), 4)
+        self.assertIn(3, candidates)
+
+        version, products, snapshot_names = self.cache.get_snapshot()
+        self.assertEqual(version, self.cache.get_cache_info()['version'])
+        self.assertEqual(products[-1].article, '12348')
+        self.assertIs(snapshot_names, names)
     
     def test_cache_info(self):
         """Test cache info retrieval"""
@@ -253,6 +278,32 @@ class TestEnhancedProductMatcher(unittest.TestCase):
         self.assertEqual(score, 100)
         self.assertEqual(method, 'exact_product')
     
+    def test_prefix_article_match(self):
+        """Test unique article number prefix matching"""
+        self.cache.refresh(
+            self.products_data + [{'Article Number': 'S10142000', 'Product': 'Anti Power Black'}],
+            self.db_products
+        )
+        article, product, score, method = self.matcher.match_product(None, 's101420')
+        self.assertEqual(article, 'S10142000')
+        self.assertEqual(method, 'prefix_article')
+        
+        # A prefix scoring below the threshold is not taken
+        self.assertIsNone(self.matcher.match_product(None, 's1014')[0])
+    
+    def test_prefix_article_conflicting_name(self):
+        """Test that a product name contradicting the article prefix wins"""
+        self.cache.refresh(
+            self.products_data + [{'Article Number': 'S10142000', 'Product': 'Anti Power Black'}],
+            self.db_products
+        )
+        # Without a name the prefix is taken
+        self.assertEqual(self.matcher.match_product(None, 'S10142')[3], 'prefix_article')
+        
+        article, product, score, method = self.matcher.match_product('Tenergy 05 Red', 'S10142')
+        self.assertEqual(article, '12347')
+        self.assertEqual(method, 'fuzzy_product_token_enhanced')
+    
     def test_synonym_match(self):
         """Test synonym matching"""
         article, product, score, method = self.matcher.match_product('R9 Black', None)
@@ -378,10 +429,123 @@ class TestUnmatchedTracker(unittest.TestCase):
             self.assertIn('summary', data)
             self.assertIn('unmatched_items', data)
             self.assertEqual(len(data['unmatched_items']), 1)
+            self.assertEqual(data['summary']['by_reason']['no_match_found'], {'count': 1})
         finally:
             os.unlink(temp_path)
 
 
+class TestProductVersionManager(unittest.TestCase):
+    """Test product versioning and soft deletion"""
+    
+    def setUp(self):
+        """Set up a manager on a temporary database"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.old_db_path = database.DB_PATH
+        database.DB_PATH = os.path.join(self.temp_dir.name, 'test.db')
+        database.init_database()
+        for article in ('A1', 'A2', 'A3'):
+            database.add_product(article, f'Product {article}')
+        self.manager = ProductVersionManager(database)
+    
+    def tearDown(self):
+        """Restore the database path"""
+        database.DB_PATH = self.old_db_path
+        self.temp_dir.cleanup()
+    
+    def test_soft_delete_and_restore_products(self):
+        """Test bulk soft deletion and restoration"""
+        count = self.manager.soft_delete_products(['A1', 'A2', 'MISSING'], 'old')
+        self.assertEqual(count, 2)
+        self.assertEqual(database.get_product_by_article('A1')['is_discontinued'], 1)
+        self.assertEqual(database.get_product_by_article('A2')['is_available'], 0)
+        self.assertEqual(database.get_product_by_article('A3')['is_discontinued'], 0)
+        
+        history = self.manager.get_product_history('A1')
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0].change_reason, 'Soft deletion: old')
+        self.assertEqual(history[0].is_discontinued, 0)
+        
+        self.assertEqual(len(self.manager.get_change_log()), 2)
+        
+        self.assertEqual(self.manager.restore_products(['A1', 'A2']), 2)
+        self.assertEqual(database.get_product_by_article('A1')['is_available'], 1)
+        self.assertEqual(len(self.manager.get_change_log()), 4)
+    
+    def test_products_revision(self):
+        """Test that every change to products bumps the revision"""
+        revision = database.get_products_revision()
+        database.update_product('A1', synonyms=['First'])
+        self.assertEqual(database.get_products_revision(), revision + 1)
+        self.manager.soft_delete_products(['A2'], 'old')
+        self.assertGreater(database.get_products_revision(), revision + 1)
+    
+    def test_explain_old_orders(self):
+        """Test explaining several orders in one call"""
+        self.manager.create_version('A1', 'Rename')
+        database.update_product('A1', product_name='Renamed A1')
+        
+        explanations = self.manager.explain_old_orders([
+            ('A1', '9999-12-31'), ('A2', '9999-12-31'), ('MISSING', '9999-12-31')
+        ])
+        
+        self.assertEqual([e['article_number'] for e in explanations], ['A1', 'A2', 'MISSING'])
+        self.assertEqual(explanations[0]['changes'], [{
+            'field': 'product_name', 'old_value': 'Product A1', 'new_value': 'Renamed A1'
+        }])
+        self.assertIsNone(explanations[1]['historical_state'])
+        self.assertEqual(explanations[1]['current_state']['product_name'], 'Product A2')
+        self.assertIsNone(explanations[2]['current_state'])
+    
+    def test_find_versions_with_synonym(self):
+        """Test filtering history by a synonym"""
+        database.update_product('A1', synonyms=['Old Name'])
+        self.manager.create_version('A1', 'Rename')
+        database.update_product('A1', synonyms=['New Name'])
+        self.manager.create_version('A1', 'Rename again')
+        
+        versions = self.manager.find_versions_with_synonym('A1', 'OLD NAME')
+        
+        self.assertEqual([v.change_reason for v in versions], ['Rename'])
+        self.assertEqual(self.manager.find_versions_with_synonym('A2', 'old name'), [])
+
+
+class TestOrderStatus(unittest.TestCase):
+    """Test the status of orders finalized in the background"""
+    
+    def setUp(self):
+        """Use a temporary database"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.old_db_path = database.DB_PATH
+        database.DB_PATH = os.path.join(self.temp_dir.name, 'test.db')
+        database.init_database()
+        self.statistics = {'total_items': 1, 'matched_items': 1, 'unmatched_items': 0}
+        self.orders = [{'original_product': 'Widget', 'matched_article': 'A1', 'status': 'matched'}]
+    
+    def tearDown(self):
+        """Restore the database path"""
+        database.DB_PATH = self.old_db_path
+        self.temp_dir.cleanup()
+    
+    def test_pending_then_completed(self):
+        """Test that saving the items completes a pending order"""
+        order_id = database.create_order_history('C1', self.statistics, self.orders, 'out.xlsx')
+        self.assertEqual(database.get_output_status('out.xlsx'), ('pending', None))
+        self.assertEqual(database.get_order_status(order_id), ('pending', None))
+        
+        database.save_order_items(order_id, self.orders)
+        self.assertEqual(database.get_output_status('out.xlsx'), ('completed', None))
+        self.assertEqual(database.get_order_status(order_id), ('completed', None))
+        self.assertIsNone(database.get_order_status(order_id + 1))
+        self.assertEqual(len(database.get_order_items(order_id)), 1)
+        self.assertIsNone(database.get_output_status('missing.xlsx'))
+    
+    def test_failed(self):
+        """Test that a failed order keeps its error"""
+        order_id = database.create_order_history('C1', self.statistics, self.orders, 'out.xlsx')
+        database.mark_order_failed(order_id, ValueError('template missing'))
+        self.assertEqual(database.get_output_status('out.xlsx'), ('failed', 'template missing'))
+
+
 class TestIntegration(unittest.TestCase):
     """Integration tests for complete workflow"""
     
@@ -434,6 +598,8 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestEnhancedProductMatcher))
     suite.addTests(loader.loadTestsFromTestCase(TestTokenMatcher))
     suite.addTests(loader.loadTestsFromTestCase(TestUnmatchedTracker))
+    suite.addTests(loader.loadTestsFromTestCase(TestProductVersionManager))
+    suite.addTests(loader.loadTestsFromTestCase(TestOrderStatus))
     suite.addTests(loader.loadTestsFromTestCase(TestIntegration))
     
     # Run tests
@@ -3,15 +3,36 @@ Unmatched Items Tracker
 Groups and analyzes unmatched items by root cause
 """
 
-import json
+import orjson
 import logging
-from typing import List, Dict, Optional
-from collections import defaultdict
+import time
+import gzip
+import io
+from typing import List, Dict, Optional, Iterator, Iterable, TextIO, BinaryIO
+from collections import defaultdict, Counter
 from datetime import datetime
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+# (time.time(), its isoformat) of the last timestamp handed out
+_now_cache = (0.0, '')
+
+
+def _now_iso() -> str:
+    """
+    Current local time as an ISO string, like datetime.now().isoformat(),
+    but reused for calls within the same millisecond so bulk adds skip the
+    datetime construction and formatting.
+    """
+    global _now_cache
+    now = time.time()
+    cached_at, cached = _now_cache
+    if not 0 <= now - cached_at < 0.001:
+        cached = datetime.fromtimestamp(now).isoformat()
+        _now_cache = (now, cached)
+    return cached
+
 
 class UnmatchedReason(Enum):
     """Enumeration of reasons for unmatched items"""
@@ -25,9 +46,19 @@ class UnmatchedReason(Enum):
     MISSING_DATA = "missing_data"
 
 
+# Enum .value goes through a descriptor; a plain dict lookup is cheaper
+_REASON_VALUE = {reason: reason.value for reason in UnmatchedReason}
+# Section headings of the text report
+_REASON_UPPER = {reason: reason.value.upper() for reason in UnmatchedReason}
+
+
 class UnmatchedItem:
     """Represents an unmatched item with detailed information"""
     
+    __slots__ = (
+        'original_text', 'reason', 'details', '_suggestions', 'timestamp', '_dict_cache'
+    )
+    
     def __init__(
         self,
         original_text: str,
@@ -38,18 +69,70 @@ class UnmatchedItem:
         self.original_text = original_text
         self.reason = reason
         self.details = details
-        self.suggestions = suggestions or []
-        self.timestamp = datetime.now().isoformat()
+        self._suggestions = suggestions or []
+        self.timestamp = _now_iso()
+        self._dict_cache = None
+    
+    @property
+    def suggestions(self) -> List[Dict]:
+        """Suggested matches for the item"""
+        return self._suggestions
+    
+    @suggestions.setter
+    def suggestions(self, suggestions: List[Dict]) -> None:
+        # Suggestions are filled in after the item is tracked; drop the cached dict
+        self._suggestions = suggestions
+        self._dict_cache = None
     
     def to_dict(self) -> Dict:
-        """Convert to dictionary for serialization"""
-        return {
-            'original_text': self.original_text,
-            'reason': self.reason.value,
-            'details': self.details,
-            'suggestions': self.suggestions,
-            'timestamp': self.timestamp
-        }
+        """
+        Convert to dictionary for serialization. The dict is built once and
+        shared by later calls (summary, export), so treat it as read-only.
+        """
+        if self._dict_cache is None:
+            self._dict_cache = {
+                'original_text': self.original_text,
+                'reason': _REASON_VALUE[self.reason],
+                'details': self.details,
+                'suggestions': self._suggestions,
+                'timestamp': self.timestamp
+            }
+        return self._dict_cache
+
+
+def _json_default(obj):
+    """Serialize the tracker's own objects for orjson without a to_dict pre-pass"""
+    if isinstance(obj, UnmatchedItem):
+        return obj.to_dict()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+_JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _dump_nested(value, indent: bytes) -> bytes:
+    """
+    orjson's output for value nested at a given depth: indented one level
+    deeper by indent, or compact when indent is empty.
+    """
+    if not indent:
+        return orjson.dumps(value, default=_json_default, option=_JSON_OPTIONS)
+    # Newlines inside JSON strings are escaped, so every raw one starts a line
+    return orjson.dumps(
+        value, default=_json_default, option=_JSON_OPTIONS | orjson.OPT_INDENT_2
+    ).replace(b'\n', b'\n' + indent)
+
+
+def _write_json_array(f: BinaryIO, items: Iterable, pretty: bool) -> None:
+    """Write items as a top-level member's JSON array, one element at a time"""
+    indent = b'    ' if pretty else b''
+    newline = b'\n' if pretty else b''
+    separator = first = b'[' + newline + indent
+    for item in items:
+        f.write(separator)
+        f.write(_dump_nested(item, indent))
+        separator = b',' + newline + indent
+    f.write(b'[]' if separator is first else newline + indent[2:] + b']')
 
 
 class UnmatchedTracker:
@@ -58,7 +141,9 @@ class UnmatchedTracker:
     def __init__(self):
         self.unmatched_items = []
         self.items_by_reason = defaultdict(list)
-        self.warning_items = []  # Items that matched but have warnings
+        # Items that matched but have warnings, as (matched_item, warnings,
+        # time.time()) tuples; dicts are only built by get_all_warnings
+        self.warning_items = []
     
     def add_unmatched(
         self,
@@ -80,7 +165,8 @@ class UnmatchedTracker:
         self.unmatched_items.append(item)
         self.items_by_reason[reason].append(item)
         
-        logger.warning(f"Unmatched item: {original_text} - Reason: {reason.value}")
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning("Unmatched item: %s - Reason: %s", original_text, _REASON_VALUE[reason])
     
     def add_warning(
         self,
@@ -94,15 +180,15 @@ class UnmatchedTracker:
             matched_item: The matched item data
             warnings: List of warning messages
         """
-        warning_entry = {
-            'matched_item': matched_item,
-            'warnings': warnings,
-            'timestamp': datetime.now().isoformat()
-        }
-        self.warning_items.append(warning_entry)
+        self.warning_items.append((matched_item, warnings, time.time()))
     
-    def get_summary(self) -> Dict:
-        """Get a summary of unmatched items grouped by reason"""
+    def get_summary(self, summary_only: bool = False) -> Dict:
+        """
+        Get a summary of unmatched items grouped by reason.
+        
+        Args:
+            summary_only: Only count the items of each reason, without listing them
+        """
         summary = {
             'total_unmatched': len(self.unmatched_items),
             'total_warnings': len(self.warning_items),
@@ -110,10 +196,13 @@ class UnmatchedTracker:
         }
         
         for reason, items in self.items_by_reason.items():
-            summary['by_reason'][reason.value] = {
-                'count': len(items),
-                'items': [item.to_dict() for item in items]
-            }
+            if summary_only:
+                summary['by_reason'][_REASON_VALUE[reason]] = {'count': len(items)}
+            else:
+                summary['by_reason'][_REASON_VALUE[reason]] = {
+                    'count': len(items),
+                    'items': [item.to_dict() for item in items]
+                }
         
         return summary
     
@@ -130,70 +219,109 @@ class UnmatchedTracker:
     
     def get_all_warnings(self) -> List[Dict]:
         """Get all warning items"""
-        return self.warning_items.copy()
+        return list(self._iter_warnings())
     
-    def export_to_json(self, filepath: str) -> None:
+    def _iter_warnings(self) -> Iterator[Dict]:
+        """Yield the warning items as dicts, one at a time"""
+        for matched_item, warnings, added_at in self.warning_items:
+            yield {
+                'matched_item': matched_item,
+                'warnings': warnings,
+                'timestamp': datetime.fromtimestamp(added_at).isoformat()
+            }
+    
+    def export_to_json(self, filepath: str, pretty: Optional[bool] = None) -> None:
         """
-        Export unmatched items to JSON file.
+        Export unmatched items to JSON file. A path ending in .gz is written
+        gzip-compressed.
         
         Args:
             filepath: Path to output JSON file
+            pretty: Indent the JSON; defaults to True for plain files and
+                False for .gz files
         """
-        data = {
-            'summary': self.get_summary(),
-            'unmatched_items': self.get_all_unmatched(),
-            'warning_items': self.get_all_warnings(),
-            'generated_at': datetime.now().isoformat()
-        }
+        compressed = filepath.endswith('.gz')
+        if pretty is None:
+            pretty = not compressed
         
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
+        if compressed:
+            # Fast compression level; the buffer hands zlib large blocks
+            f = io.BufferedWriter(gzip.open(filepath, 'wb', compresslevel=1), 1 << 20)
+        else:
+            f = open(filepath, 'wb', buffering=1 << 20)
+        
+        indent = b'  ' if pretty else b''
+        newline = b'\n' + indent if pretty else b''
+        member = b',' + newline
+        colon = b': ' if pretty else b':'
+        
+        # Same bytes as orjson's dump of the whole object, but the item
+        # arrays are streamed so only one element is encoded at a time
+        with f:
+            f.write(b'{' + newline + b'"summary"' + colon)
+            # The items themselves follow in unmatched_items, so the summary
+            # only carries the counts
+            f.write(_dump_nested(self.get_summary(summary_only=True), indent))
+            f.write(member + b'"unmatched_items"' + colon)
+            _write_json_array(f, self.unmatched_items, pretty)
+            f.write(member + b'"warning_items"' + colon)
+            _write_json_array(f, self._iter_warnings(), pretty)
+            f.write(member + b'"generated_at"' + colon)
+            f.write(orjson.dumps(datetime.now().isoformat()))
+            f.write(b'\n}' if pretty else b'}')
         
         logger.info(f"Exported unmatched items to {filepath}")
     
     def generate_report(self) -> str:
         """Generate a human-readable report of unmatched items"""
-        report_lines = [
-            "=" * 80,
-            "UNMATCHED ITEMS REPORT",
-            "=" * 80,
-            f"Generated: {datetime.now().isoformat()}",
-            f"Total Unmatched: {len(self.unmatched_items)}",
-            f"Total Warnings: {len(self.warning_items)}",
-            "",
-            "BREAKDOWN BY REASON:",
-            "-" * 80
-        ]
+        return "\n".join(self.iter_report_lines())
+    
+    def write_report(self, f: TextIO) -> None:
+        """Write the human-readable report to an open text file line by line"""
+        lines = self.iter_report_lines()
+        f.write(next(lines))
+        for line in lines:
+            f.write("\n")
+            f.write(line)
+    
+    def iter_report_lines(self) -> Iterator[str]:
+        """Yield the lines of the human-readable report"""
+        yield "=" * 80
+        yield "UNMATCHED ITEMS REPORT"
+        yield "=" * 80
+        yield f"Generated: {datetime.now().isoformat()}"
+        yield f"Total Unmatched: {len(self.unmatched_items)}"
+        yield f"Total Warnings: {len(self.warning_items)}"
+        yield ""
+        yield "BREAKDOWN BY REASON:"
+        yield "-" * 80
         
         for reason, items in self.items_by_reason.items():
-            report_lines.append(f"\n{reason.value.upper()} ({len(items)} items):")
-            report_lines.append("-" * 40)
+            yield f"\n{_REASON_UPPER[reason]} ({len(items)} items):"
+            yield "-" * 40
             
             for item in items[:10]:  # Show first 10 items per reason
-                report_lines.append(f"  • {item.original_text}")
+                yield f"  • {item.original_text}"
                 if item.suggestions:
-                    report_lines.append(f"    Suggestions: {len(item.suggestions)}")
+                    yield f"    Suggestions: {len(item.suggestions)}"
             
             if len(items) > 10:
-                report_lines.append(f"  ... and {len(items) - 10} more")
+                yield f"  ... and {len(items) - 10} more"
         
         if self.warning_items:
-            report_lines.append("\n" + "=" * 80)
-            report_lines.append("ITEMS WITH WARNINGS:")
-            report_lines.append("-" * 80)
+            yield "\n" + "=" * 80
+            yield "ITEMS WITH WARNINGS:"
+            yield "-" * 80
             
-            for warning in self.warning_items[:20]:  # Show first 20 warnings
-                item = warning['matched_item']
-                report_lines.append(
+            for item, warnings, _ in self.warning_items[:20]:  # Show first 20 warnings
+                yield (
                     f"  • {item.get('original_product')} -> "
                     f"{item.get('matched_product')}"
                 )
-                for w in warning['warnings']:
-                    report_lines.append(f"    ⚠ {w}")
-        
-        report_lines.append("\n" + "=" * 80)
+                for w in warnings:
+                    yield f"    ⚠ {w}"
         
-        return "\n".join(report_lines)
+        yield "\n" + "=" * 80
 
 
 class UnmatchedAnalyzer:
@@ -210,49 +338,32 @@ class UnmatchedAnalyzer:
         Returns:
             Dictionary with analysis results
         """
-        analysis = {
-            'common_prefixes': defaultdict(int),
-            'common_suffixes': defaultdict(int),
-            'common_words': defaultdict(int),
-            'potential_synonyms': []
-        }
-        
-        for item in unmatched_items:
-            text = item.original_text.lower()
-            words = text.split()
-            
-            # Track common words
-            for word in words:
-                if len(word) > 3:  # Ignore short words
-                    analysis['common_words'][word] += 1
-            
-            # Track prefixes and suffixes
-            if len(words) > 0:
-                analysis['common_prefixes'][words[0]] += 1
-                analysis['common_suffixes'][words[-1]] += 1
-            
-            # Check if item has suggestions (potential synonyms)
-            if item.suggestions:
-                for suggestion in item.suggestions:
-                    analysis['potential_synonyms'].append({
-                        'original': item.original_text,
-                        'suggested': suggestion.get('product_name'),
-                        'score': suggestion.get('score')
-                    })
+        words_per_item = [item.original_text.lower().split() for item in unmatched_items]
         
-        # Sort by frequency
-        analysis['common_prefixes'] = dict(
-            sorted(analysis['common_prefixes'].items(),
-                  key=lambda x: x[1], reverse=True)[:10]
-        )
-        analysis['common_suffixes'] = dict(
-            sorted(analysis['common_suffixes'].items(),
-                  key=lambda x: x[1], reverse=True)[:10]
-        )
-        analysis['common_words'] = dict(
-            sorted(analysis['common_words'].items(),
-                  key=lambda x: x[1], reverse=True)[:20]
+        # Counter tallies in C; most_common selects with a bounded heap and
+        # keeps ties in first-seen order
+        common_words = Counter(
+            word for words in words_per_item for word in words
+            if len(word) > 3  # Ignore short words
         )
+        common_prefixes = Counter(words[0] for words in words_per_item if words)
+        common_suffixes = Counter(words[-1] for words in words_per_item if words)
+        
+        analysis = {
+            'common_prefixes': dict(common_prefixes.most_common(10)),
+            'common_suffixes': dict(common_suffixes.most_common(10)),
+            'common_words': dict(common_words.most_common(20)),
+            # Suggestions of unmatched items are potential synonyms
+            'potential_synonyms': [
+                {
+                    'original': item.original_text,
+                    'suggested': suggestion.get('product_name'),
+                    'score': suggestion.get('score')
+                }
+                for item in unmatched_items
+                for suggestion in item.suggestions
+            ]
+        }
         
         return analysis
     